@@ -0,0 +1,16 @@
+"""This packages provides classes for reading and writing Maya's IFF_
+inspired :ref:`binary file format <binary_anatomy>`.
+
+.. _IFF: http://en.wikipedia.org/wiki/Interchange_File_Format
+
+"""
+
+from .core import (
+    Encoder, StructEncoder, StringEncoder, encoders, register_encoder,
+    tag_encoding, get_encoder, format_tag, hexdump,
+    Node, Group, Chunk, LazyChunk, Parser, IterParser, iterparse, parse,
+)
+from .index import Index, get_default_cache_dir, get_index_path
+from .selector import Selector, compile_selector
+from .validation import ValidationError, validate
+from .writer import Writer, patch_chunk
@@ -0,0 +1,222 @@
+import functools
+import itertools
+import multiprocessing
+import sys
+from cStringIO import StringIO
+from optparse import OptionParser
+
+from .core import Group, Parser, format_tag, hexdump, iterparse, tag_encoding
+
+
+def main():
+
+    opt_parser = OptionParser()
+    opt_parser.add_option('-t', '--type', action='append', default=[])
+    opt_parser.add_option('-n', '--no-types', action='store_true')
+    opt_parser.add_option('-x', '--hex', action='store_true')
+    opt_parser.add_option('-o', '--offset', type='int', default=0,
+        help='where to start the hexdump')
+    opt_parser.add_option('-l', '--length', type='int',
+        help='how many bytes to hexdump')
+    opt_parser.add_option('-d', '--data', action='store_true')
+    opt_parser.add_option('-s', '--sort', choices=['size'])
+    opt_parser.add_option('-S', '--summary', action='store_true',
+        help='print node counts and bytes per tag, instead of the structure')
+    opt_parser.add_option('-j', '--jobs', type='int', default=1,
+        help='parse this many files at once')
+    opts, args = opt_parser.parse_args()
+
+    if opts.offset < 0:
+        opt_parser.error('--offset must not be negative')
+    if opts.length is not None and opts.length < 0:
+        opt_parser.error('--length must not be negative')
+
+    if opts.hex:
+        failed = False
+        for arg in args:
+            try:
+                print_hexdump(arg, opts.offset, opts.length)
+            except IOError as e:
+                failed = True
+                print >> sys.stderr, '%s: %s' % (arg, e)
+                continue
+            print
+        if failed:
+            exit(1)
+        return
+
+    if opts.no_types:
+        tag_encoding.clear()
+
+    for type_spec in opts.type:
+        type_spec = type_spec.split(':')
+        names = type_spec[0].split(',')
+        if len(type_spec) == 1:
+            for name in names:
+                tag_encoding.pop(name, None)
+        elif len(type_spec) == 2:
+            for name in names:
+                tag_encoding[name] = type_spec[1]
+        else:
+            raise ValueError('type spec should look like NAME:type')
+
+
+    # Workers are forked, and so inherit the types from above. Results come
+    # back in the same order as the arguments.
+    pool = None
+    if opts.jobs > 1 and len(args) > 1:
+        pool = multiprocessing.Pool(min(opts.jobs, len(args)))
+        results = pool.imap(functools.partial(_process_captured, opts), args)
+    else:
+        results = itertools.imap(functools.partial(_process, opts), args)
+
+    totals = {}
+    failed = False
+    for path, output, summary, error in results:
+        if output:
+            sys.stdout.write(output)
+        if error:
+            failed = True
+            print >> sys.stderr, '%s: %s' % (path, error)
+        if summary:
+            for tag, (count, size) in summary.iteritems():
+                total = totals.setdefault(tag, [0, 0])
+                total[0] += count
+                total[1] += size
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    if opts.summary and len(args) > 1:
+        print_summary('TOTAL', totals)
+
+    if failed:
+        exit(1)
+
+
+def _process(opts, path):
+    """Print one file for :func:`main`, returning ``(path, output, summary, error)``.
+
+    Errors are returned instead of raised, so that one bad file does not
+    stop the rest from being processed.
+
+    """
+    summary = error = None
+    try:
+        if opts.summary:
+            summary = summarize(path)
+            print_summary(path, summary)
+        elif opts.sort:
+            # Sorting requires the whole graph.
+            parser = Parser.from_path(path, mmap=True)
+            try:
+                parser.parse_all()
+                for node in parser.walk():
+                    children = getattr(node, 'children', None)
+                    if isinstance(children, list):
+                        children.sort(key=lambda x: getattr(x, opts.sort, 0), reverse=True)
+                parser.pprint(data=opts.data)
+            finally:
+                parser.close()
+        else:
+            events = iterparse(path, mmap=True)
+            try:
+                pprint_events(events, data=opts.data)
+            finally:
+                events.close()
+    except (IOError, ValueError) as e:
+        error = str(e)
+    except Exception as e:
+        error = '%s: %s' % (e.__class__.__name__, e)
+    return path, None, summary, error
+
+
+def _process_captured(opts, path):
+    """Like :func:`_process`, but returning what is printed instead of printing it."""
+    stdout = sys.stdout
+    sys.stdout = buffer_ = StringIO()
+    try:
+        path, output, summary, error = _process(opts, path)
+    finally:
+        sys.stdout = stdout
+    return path, buffer_.getvalue(), summary, error
+
+
+def print_hexdump(path, offset=0, length=None, block_size=65536):
+    """Print a hexdump of the given range of a file, reading only that range.
+
+    :raises ValueError: if the offset or length is negative.
+
+    """
+    if offset < 0 or (length is not None and length < 0):
+        raise ValueError('offset and length must not be negative; got %r and %r' % (offset, length))
+    with open(path, 'rb') as fh:
+        fh.seek(offset)
+        while length is None or length > 0:
+            data = fh.read(block_size if length is None else min(block_size, length))
+            if not data:
+                break
+            sys.stdout.write(hexdump(data, offset))
+            offset += len(data)
+            if length is not None:
+                length -= len(data)
+
+
+def summarize(path):
+    """Count the nodes of each tag in a file, and the bytes that they take.
+
+    Only the headers are read. The bytes of groups include their children.
+
+    :returns: ``{tag: (count, bytes)}``
+
+    """
+    summary = {}
+    events = iterparse(path, lazy=True, eager=())
+    try:
+        for event, node in events:
+            if event != 'end':
+                count, size = summary.get(node.tag, (0, 0))
+                summary[node.tag] = (count + 1, size + node.size)
+    finally:
+        events.close()
+    return summary
+
+
+def print_summary(name, summary):
+    """Print the results of :func:`summarize`, largest first."""
+    print '%s: %d nodes' % (name, sum(count for count, size in summary.itervalues()))
+    for tag, (count, size) in sorted(summary.iteritems(), key=lambda x: (-x[1][1], x[0])):
+        print '    %-10s %10d %16d' % (format_tag(tag), count, size)
+
+
+def pprint_events(events, data=False):
+    """Print the structure of a file as it is parsed; see :meth:`Parser.pprint`.
+
+    Since the groups are printed before their children are parsed, they do not
+    report how many children they have.
+
+    """
+
+    depth = 0
+
+    # We hold onto the group until we see if its first child is a CREA.
+    pending = None
+
+    for event, node in events:
+
+        if pending is not None:
+            print pending.format_header(node if event == 'chunk' else None, _indent=depth - 1)
+            pending = None
+
+        if event == 'start':
+            pending = node
+            depth += 1
+        elif event == 'end':
+            depth -= 1
+        else:
+            node.pprint(data, depth)
+
+
+if __name__ == '__main__':
+    main()
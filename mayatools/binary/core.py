@@ -0,0 +1,1064 @@
+import array
+import binascii
+import functools
+import itertools
+import mmap as _mmap
+import struct
+import string
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .selector import compile_selector
+
+
+_is_printable = set(string.printable).difference(string.whitespace).__contains__
+
+# For str.translate, to replace unprintable characters in bulk.
+_printable_table = ''.join(c if _is_printable(c) else '.' for c in map(chr, xrange(256)))
+
+
+class Encoder(object):
+
+    """The base class for encoding/decoding packed data to/from native types."""
+
+    def split(self, encoded, size_hint):
+        """Return an iterator over a split version of the encoded data.
+
+        :param str encoded: The packed data to split.
+        :param int size_hint: The suggested split size. Feel free to ignore
+            this if your data has an implicit size of its own.
+
+        """
+        for i in xrange(0, len(encoded), size_hint):
+            yield encoded[i:i + size_hint]
+
+    def repr_chunk(self, chunk):
+        """Create string representation of a chunk returned from :meth:`split`."""
+        return str(chunk).translate(_printable_table)
+
+
+class StructEncoder(Encoder):
+
+    def __init__(self, format_char):
+        self.format_char = format_char
+        self.size = struct.Struct('>' + format_char).size
+
+    def split(self, encoded, size_hint):
+        size_hint = size_hint - (size_hint % self.size)
+        return super(StructEncoder, self).split(encoded, size_hint)
+
+    def unpack(self, encoded):
+        count, rem = divmod(len(encoded), self.size)
+        if rem:
+            raise ValueError('encoded length %d is not multiple of %d; %d remains' % (len(encoded), self.size, rem))
+        return struct.unpack('>%d%s' % (count, self.format_char), encoded)
+
+    def repr_chunk(self, encoded):
+        return ' '.join(repr(x) for x in self.unpack(encoded))
+
+
+class StringEncoder(Encoder):
+
+    def split(self, encoded, size_hint):
+        return encoded.rstrip('\0').split('\0')
+
+    def repr_chunk(self, chunk):
+        return repr(chunk)
+
+
+# Map encoding names to the object which exposes the Encoder interface.
+encoders = {}
+
+
+def register_encoder(names, encoder=None):
+    """Register an :class:`Encoder` for the given type names.
+
+    These types are a concept of this module, and have no parallel in the file
+    format itself. These are what we use to unpack the raw binary data into
+    something standard Python types.
+
+    Types that are registered upon import include:
+
+    * ``"float"``;
+    * ``"double"``;
+    * ``"uint"`` (32-bit big-endian integer);
+    * ``"string"`` (``NULL`` terminated).
+
+    :param names: A string, or iterable of strings.
+    :param encoder: The :class:`Encoder` to use for this type.
+
+    This function can operate as a decorator as well::
+
+        @register_encoder('attr')
+        class AttributeEncoder(mayatools.binary.Encoder):
+            pass
+
+    """
+
+    if isinstance(names, basestring):
+        names = [names]
+    if encoder is None:
+        return functools.partial(register_encoder, names)
+    else:
+        for name in names:
+            encoders[name] = encoder
+        return encoder
+
+
+register_encoder('float', StructEncoder('f'))
+register_encoder('double', StructEncoder('d'))
+register_encoder('uint', StructEncoder('L'))
+register_encoder('string', StringEncoder())
+
+
+#: Map tag names to the name of an encoding. Add to this dict to interpret tags
+#: as certain types.
+tag_encoding = {
+    
+    # Maya headers.
+    'VERS': 'string', # app version
+    'UVER': 'string',
+    'MADE': 'string',
+    'CHNG': 'string', # timestamp
+    'ICON': 'string',
+    'INFO': 'string',
+    'OBJN': 'string',
+    'INCL': 'string',
+    'LUNI': 'string', # linear unit
+    'TUNI': 'string', # time unit
+    'AUNI': 'string', # angle unit
+    'FINF': 'string', # file info
+
+    # Generic.
+    'SIZE': 'uint',
+
+    # DAG
+    'CREA': 'string', # create node
+    'STR ': 'string', # string attribute
+
+    # Cache headers.
+    'VRSN': 'string', # cache version
+    'STIM': 'uint',   # cache start time
+    'ETIM': 'uint',   # cache end time
+
+    # Cache channels.
+    'CHNM': 'string', # channel name
+
+    # Cache data.
+    'FBCA': 'float',  # floating cache array
+    'FVCA': 'float',  # float vector cache array
+    'DVCA': 'double', # double vector cache array
+
+}
+
+
+def _find_typecode(format_char, typecodes):
+    size = struct.calcsize('>' + format_char)
+    for typecode in typecodes:
+        if array.array(typecode).itemsize == size:
+            return typecode
+
+
+# Array typecodes whose native size matches the packed size of a struct
+# format, so that the data can be converted by swapping bytes instead of
+# packing each value. Unsigned longs are 8 bytes on LP64, so are usually "I".
+_array_typecodes = dict(
+    (format_char, typecode) for format_char, typecode in (
+        ('f', _find_typecode('f', 'f')),
+        ('L', _find_typecode('L', 'IL')),
+    ) if typecode
+)
+_swap_bytes = sys.byteorder == 'little'
+
+_numpy_dtypes = {
+    'float': '>f4',
+    'double': '>f8',
+    'uint': '>u4',
+}
+
+
+def get_encoder(tag):
+    """Get an :class:`Encoder` for the given tag.
+
+    :param str: The 4 character node "tag".
+    :returns: The appropriate :class:`Encoder` or ``None``.
+
+    """
+    encoding = tag_encoding.get(tag, 'raw')
+    return encoders.get(encoding) or Encoder()
+
+
+def format_tag(tag):
+    """Format a tag for display.
+
+    Tags are usually readable (e.g. ``"STR "``), but plugin types often have
+    binary IDs, which are shown in hex (e.g. ``"0x00080001"``).
+
+    """
+    return tag if tag.rstrip().isalnum() else '0x' + tag.encode('hex')
+
+
+def hexdump(*args, **kwargs):
+    return ''.join(_hexdump(*args, **kwargs))
+
+def _hexdump(raw, initial_offset=0, chunk=4, line=16, indent='', tag=None):
+
+    chunk2 = 2 * chunk
+    line2 = 2 * line
+    encoder = get_encoder(tag)
+    offset = initial_offset
+
+    # Raw data is split into regular lines, so it is converted all at once.
+    if type(encoder) is Encoder:
+        raw = str(raw)
+        hex_raw = binascii.hexlify(raw)
+        text = raw.translate(_printable_table)
+        for start in xrange(0, len(raw), line):
+            hex_chunk = hex_raw[2 * start:2 * start + line2].ljust(line2)
+            yield '%s%04x: %s %s\n' % (
+                indent, offset + start,
+                ' '.join([hex_chunk[i:i + chunk2] for i in xrange(0, line2, chunk2)]),
+                text[start:start + line],
+            )
+        return
+
+    for encoded_chunk in encoder.split(raw, line):
+        if not encoded_chunk:
+            continue
+
+        # Encode the chunk to hex, pad it, and chunk it further.
+        hex_chunk = binascii.hexlify(encoded_chunk).ljust(line2)
+        yield '%s%04x: %s %s\n' % (
+            indent, offset,
+            ' '.join([hex_chunk[i:i + chunk2] for i in xrange(0, len(hex_chunk), chunk2)]),
+            encoder.repr_chunk(encoded_chunk),
+        )
+        offset += len(encoded_chunk)
+
+
+_group_tags = set()
+_tag_alignments = {}
+
+for base in ('FORM', 'CAT ', 'LIST', 'PROP'):
+    for char, alignment in (('', 2), ('4', 4), ('8', 8)):
+        tag = base[:-len(char)] + char if char else base
+        _group_tags.add(tag)
+        _tag_alignments[tag] = alignment
+
+def _group_is_64bit(tag):
+    return _tag_alignments.get(tag) == 8
+
+def _get_tag_alignment(tag):
+    return _tag_alignments.get(tag, 2)
+
+def _get_group_type(type_, is_64bit):
+    """Get the equivalent of a group type for a 32 or 64-bit file.
+
+    64-bit files only have 8-aligned groups, and 32-bit files can't have them.
+
+    """
+    if is_64bit:
+        return type_[:3] + '8'
+    if _tag_alignments.get(type_) == 8:
+        return type_[:3] + '4'
+    return type_
+
+# The largest size that a 32-bit file can record.
+_max_32bit_size = 0xffffffff
+
+
+def _get_padding(size, alignment):
+    if size % alignment == 0:
+        return 0
+    else:
+        return alignment - size % alignment
+
+
+class Node(object):
+
+    """Base class for group nodes in, and the root node of a Maya file graph."""
+
+    # Large files have millions of nodes, so they don't get a __dict__.
+    __slots__ = ('children', 'parent')
+
+    def __init__(self):
+
+        #: The children of this node.
+        self.children = []
+
+    def add_child(self, child):
+        self.children.append(child)
+        child.parent = self
+        return child
+
+    def add_group(self, *args, **kwargs):
+        return self.add_child(Group(*args, **kwargs))
+
+    def add_chunk(self, *args, **kwargs):
+        return self.add_child(Chunk(*args, **kwargs))
+
+    def find(self, tag):
+        """Iterate across all descendants of this node with a given tag."""
+        for child in self.children:
+            if child.tag == tag:
+                yield child
+            if isinstance(child, Node):
+                for x in child.find(tag):
+                    yield x
+
+    def find_one(self, tag, *args):
+        """Find the first descendant of this node with a given tag.
+
+        :param str tag: The tag to find.
+        :param default: What to return if we can't find a node.
+        :raises KeyError: if we can't find a tag and no default is given.
+
+        """
+        for child in self.find(tag):
+            return child
+        if args:
+            return args[0]
+        raise KeyError(tag)
+
+    def select(self, selector):
+        """Iterate across the descendants of this node matching a selector.
+
+        :param selector: A pattern (e.g. ``"MYCH/CHNM"``, ``"**/FBCA"``, or
+            ``"MYCH/CHNM+SIZE+FBCA"`` for tuples of siblings), or a compiled
+            :class:`~mayatools.binary.selector.Selector`. See
+            :mod:`mayatools.binary.selector`.
+
+        """
+        return compile_selector(selector).select(self)
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            for x in child.walk():
+                yield x
+
+    def dumps_iter(self, is_64bit=None):
+        """Iterate chunks of the packed version of this node and its children.
+
+        To write to a file::
+
+            with open(path, 'wb') as fh:
+                for chunk in node.dumps_iter():
+                    fh.write(chunk)
+
+        :param bool is_64bit: Pack with 64-bit sizes (and ``FOR8`` groups).
+            Defaults to doing so if the sizes won't fit in 32 bits, or the
+            groups are already 64-bit (e.g. if parsed from a 64-bit file).
+
+        """
+        if is_64bit is None:
+            is_64bit = self._needs_64bit()
+        for child in self.children:
+            for x in child.dumps_iter(is_64bit):
+                yield x
+
+    def packed_size(self, is_64bit=False):
+        """The number of bytes that :meth:`dumps_iter` will produce."""
+        return sum(child.packed_size(is_64bit) for child in self.children)
+
+    def _needs_64bit(self):
+        for child in self.children:
+            if isinstance(child, Group) and _group_is_64bit(child.type):
+                return True
+        return self.packed_size() > _max_32bit_size
+
+
+class Group(Node):
+
+    """A group node in a Maya file graph."""
+
+    __slots__ = ('type', 'size', 'start', 'tag', 'alignment', 'end')
+
+    def __init__(self, tag, type_='FOR4', size=0, start=0):
+        super(Group, self).__init__()
+        self.parent = None
+
+        #: The group type (e.g. ``FORM``, ``LIST``, ``PROP``, ``CAT``).
+        self.type = type_
+
+        self.size = size
+        self.start = start
+
+        #: The data type.
+        self.tag = tag
+
+        self.alignment = _get_tag_alignment(self.type)
+        self.end = self.start + self.size + _get_padding(self.size, self.alignment)
+
+    def pprint(self, data, _indent=0):
+        """Print a structured representation of the group to stdout."""
+        first = self.children[0] if self.children else None
+        print self.format_header(first, len(self.children), _indent)
+        for child in self.children:
+            child.pprint(data=data, _indent=_indent + 1)
+
+    def format_header(self, first_child=None, num_children=None, _indent=0):
+        """Format the header line of :meth:`pprint`.
+
+        :param first_child: The first child, which names the group if it is a ``CREA``.
+        :param int num_children: How many children to report, if known.
+
+        """
+        tag = format_tag(self.tag)
+        crea = first_child if (first_child is not None and first_child.tag == 'CREA') else None
+        name = str(crea.data).split('\0')[0][1:] if crea else None
+        name = ' "%s"' % name if name else ''
+        children = '' if num_children is None else ' for %d children' % num_children
+        return _indent * '    ' + ('%s group%s (%s); %d bytes%s:' % (tag, name, self.type, self.size, children))
+
+    def dumps_iter(self, is_64bit=None):
+        if is_64bit is None:
+            is_64bit = _group_is_64bit(self.type) or self.packed_size() > _max_32bit_size
+        # Sizes are computed up front so that children may be streamed.
+        type_ = _get_group_type(self.type, is_64bit)
+        size = super(Group, self).packed_size(is_64bit) + 4
+        yield (_header_64 if is_64bit else _header_32).pack(type_, size)
+        yield self.tag
+        for child in self.children:
+            for x in child.dumps_iter(is_64bit):
+                yield x
+        padding = _get_padding(size, _get_tag_alignment(type_))
+        if padding:
+            yield '\0' * padding
+
+    def packed_size(self, is_64bit=False):
+        size = super(Group, self).packed_size(is_64bit) + 4
+        type_ = _get_group_type(self.type, is_64bit)
+        return (16 if is_64bit else 8) + size + _get_padding(size, _get_tag_alignment(type_))
+
+
+class Chunk(object):
+
+    __slots__ = ('parent', 'tag', 'data', 'offset')
+
+    def __init__(self, tag, data='', offset=None, **kwargs):
+        self.parent = None
+
+        #: The data type.
+        self.tag = tag
+
+        #: Raw binary data. This is a ``str``, or a ``buffer`` into the mapped
+        #: file if parsed via ``Parser.from_path(path, mmap=True)``.
+        self.data = data
+
+        self.offset = offset
+        if kwargs:
+            for k, v in kwargs.iteritems():
+                setattr(self, k, v)
+
+    @property
+    def size(self):
+        """The size of the raw data."""
+        return len(self.data)
+
+    #: Has the data been loaded? Always true except for :class:`LazyChunk`.
+    is_loaded = True
+
+    def walk(self):
+        yield self
+
+    def pprint(self, data, _indent):
+        """Print a structured representation of the node to stdout."""
+        encoding = tag_encoding.get(self.tag)
+        if encoding:
+            header = '%d bytes as %s(s)' % (self.size, encoding)
+        else:
+            header = '%d raw bytes' % self.size
+        print _indent * '    ' + ('%s; %s' % (self.tag, header))
+
+        if data:
+            print hexdump(str(self.data), self.offset, tag=self.tag, indent=(_indent + 1) * '    ').rstrip()
+
+    def __repr__(self):
+        return '<%s %s; %d bytes>' % (self.__class__.__name__, self.tag, self.size)
+
+    def dumps_iter(self, is_64bit=False):
+        size = len(self.data)
+        yield (_header_64 if is_64bit else _header_32).pack(self.tag, size)
+        yield self.data
+        padding = _get_padding(size, self._packed_alignment(is_64bit))
+        if padding:
+            yield '\0' * padding
+
+    def packed_size(self, is_64bit=False):
+        """The number of bytes that :meth:`dumps_iter` will produce."""
+        size = self.size
+        return (16 if is_64bit else 8) + size + _get_padding(size, self._packed_alignment(is_64bit))
+
+    def _packed_alignment(self, is_64bit):
+        return _get_tag_alignment(_get_group_type(self.parent.type, is_64bit))
+
+    def _unpack(self, format_char):
+        element_size = struct.calcsize('>' + format_char)
+        if len(self.data) % element_size:
+           raise ValueError('%s is not multiple of %d for %r format' % (len(self.data), element_size, format_char))
+        typecode = _array_typecodes.get(format_char)
+        if typecode:
+            # Decode straight from the data, instead of via a huge tuple.
+            values = array.array(typecode)
+            values.fromstring(self.data)
+            if _swap_bytes:
+                values.byteswap()
+            return values
+        format_string = '>%d%s' % (len(self.data) / element_size, format_char)
+        unpacked = struct.unpack(format_string, self.data)
+        return array.array(format_char, unpacked)
+
+    def _pack(self, format_char, values):
+        typecode = _array_typecodes.get(format_char)
+        if typecode:
+            if isinstance(values, array.array) and values.typecode == typecode:
+                # Copy in bulk, rather than element by element.
+                values = values[:]
+            else:
+                values = array.array(typecode, values)
+            if _swap_bytes:
+                values.byteswap()
+            self.data = values.tostring()
+        else:
+            self.data = struct.pack('>%d%s' % (len(values), format_char), *values)
+
+    def _numpy_dtype(self, dtype):
+        if numpy is None:
+            raise RuntimeError('numpy is not installed')
+        if dtype is None:
+            encoding = tag_encoding.get(self.tag)
+            try:
+                dtype = _numpy_dtypes[encoding]
+            except KeyError:
+                raise ValueError('no numpy dtype for %r tag with %r encoding' % (self.tag, encoding))
+        return numpy.dtype(dtype).newbyteorder('>')
+
+    def as_numpy(self, dtype=None):
+        """Binary data as a :mod:`numpy` array, without copying it.
+
+        :param dtype: The type of the elements, which is always interpreted
+            as big-endian. Defaults to one suitable for the encoding of the tag
+            (e.g. ``">f4"`` for ``FBCA``).
+        :returns: A :class:`numpy.ndarray` view of the data. It is read-only
+            unless the data is in a writable buffer.
+
+        """
+        return numpy.frombuffer(self.data, self._numpy_dtype(dtype))
+
+    def set_numpy(self, values, dtype=None):
+        """Set the binary data from an array, without iterating over it in Python.
+
+        :param values: A :class:`numpy.ndarray`, :class:`array.array`, or
+            anything else that :func:`numpy.asarray` accepts.
+        :param dtype: As for :meth:`as_numpy`.
+
+        """
+        dtype = self._numpy_dtype(dtype)
+        if isinstance(values, array.array):
+            values = numpy.frombuffer(values, values.typecode)
+        self.data = numpy.asarray(values).astype(dtype, copy=False).tostring()
+
+    @property
+    def ints(self):
+        """Binary data interpreted as array of unsigned integers.
+
+        This is settable to an iterable of integers."""
+        return self._unpack('L')
+
+    @ints.setter
+    def ints(self, values):
+        self._pack('L', values)
+
+    @property
+    def floats(self):
+        """Binary data interpreted as array of floats.
+
+        This is settable to an iterable of floats."""
+        return self._unpack('f')
+
+    @floats.setter
+    def floats(self, values):
+        self._pack('f', values)
+
+    @property
+    def string(self):
+        """Binary data interpreted as a string.
+
+        This is settable with a string."""
+        return str(self.data).rstrip('\0')
+
+    @string.setter
+    def string(self, v):
+        self.data = str(v).rstrip('\0') + '\0'
+
+
+class LazyChunk(Chunk):
+
+    """A :class:`Chunk` whose data is not loaded until it is first accessed.
+
+    :param str tag: The data type.
+    :param int size: The size of the data.
+    :param loader: Function called without arguments to load the data.
+
+    """
+
+    __slots__ = ('_data', '_size', '_loader')
+
+    def __init__(self, tag, size, loader, offset=None):
+        super(LazyChunk, self).__init__(tag, None, offset)
+        self._size = size
+        self._loader = loader
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self._loader()
+            self._loader = None
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._loader = None
+
+    @property
+    def size(self):
+        """The size of the raw data, without loading it."""
+        if self._data is None:
+            return self._size
+        return len(self._data)
+
+    @property
+    def is_loaded(self):
+        return self._data is not None
+
+
+# Returned by Parser._read_node for groups which are not included.
+_skipped = object()
+
+
+# Node headers; a tag and a size, the tag being padded to 8 bytes in 64-bit files.
+_header_32 = struct.Struct('>4sL')
+_header_64 = struct.Struct('>4s4xQ')
+
+
+class _Reader(object):
+
+    """Buffered reading and decoding of the many small headers in a file.
+
+    The file is read in blocks, from which headers are decoded with
+    :func:`struct.unpack_from` instead of a few tiny reads each. Large reads
+    bypass the buffer, and memory-maps are treated as one big block.
+
+    The position of the underlying file is always at the end of the buffer.
+
+    :param file: The file to read from.
+    :param int block_size: How much to read at once; ``0`` reads exactly
+        what each field needs.
+
+    """
+
+    def __init__(self, file, block_size=65536):
+        self.file = file
+        if isinstance(file, _mmap.mmap):
+            self.block_size = None
+            self._buf = file
+            self._buf_start = 0
+            self._pos = file.tell()
+        else:
+            self.block_size = block_size
+            self._buf = ''
+            self._buf_start = file.tell()
+            self._pos = 0
+
+    def tell(self):
+        return self._buf_start + self._pos
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.tell()
+        elif whence:
+            raise ValueError('cannot seek relative to end')
+        pos = offset - self._buf_start
+        if 0 <= pos <= len(self._buf):
+            self._pos = pos
+        else:
+            self.file.seek(offset)
+            self._buf = ''
+            self._buf_start = offset
+            self._pos = 0
+
+    def _fill(self, size):
+        """Buffer at least ``size`` bytes, unless the file ends first."""
+        if self.block_size is None:
+            return
+        more = self.file.read(max(size - len(self._buf) + self._pos, self.block_size))
+        self._buf = self._buf[self._pos:] + more
+        self._buf_start += self._pos
+        self._pos = 0
+
+    def peek(self, size):
+        if self._pos + size > len(self._buf):
+            self._fill(size)
+        return self._buf[self._pos:self._pos + size]
+
+    def read(self, size):
+        end = self._pos + size
+        if end > len(self._buf):
+            if self.block_size is not None and size > self.block_size:
+                # Don't copy big reads through the buffer.
+                head = self._buf[self._pos:]
+                tail = self.file.read(size - len(head))
+                self._buf_start += len(self._buf) + len(tail)
+                self._buf = ''
+                self._pos = 0
+                return head + tail
+            self._fill(size)
+            end = self._pos + size
+        data = self._buf[self._pos:end]
+        self._pos += len(data)
+        return data
+
+    def unpack(self, struct_):
+        """Decode the next ``struct_.size`` bytes, or return ``None`` at the end of file.
+
+        :raises ValueError: if the file ends part way through.
+
+        """
+        end = self._pos + struct_.size
+        if end > len(self._buf):
+            self._fill(struct_.size)
+            end = self._pos + struct_.size
+            if end > len(self._buf):
+                if self._pos == len(self._buf):
+                    return
+                raise ValueError('Truncated header at %d.' % self.tell())
+        values = struct_.unpack_from(self._buf, self._pos)
+        self._pos = end
+        return values
+
+
+class Parser(Node):
+
+    """Maya binary file parser.
+
+    :param file: The file-like object to parse from; must support ``read(size)``
+        and ``tell()``. If it is an :class:`mmap.mmap`, chunk data will be
+        zero-copy slices of it.
+    :param bool lazy: Only record where each chunk's data is, and load it
+        from the file the first time :attr:`Chunk.data` is accessed. The file
+        must also support ``seek(offset, whence)``, and must remain open until
+        all of the data that is needed has been loaded.
+    :param eager: When lazy, the tags to load while parsing anyway; a
+        collection of tags, or a ``func(tag, size)`` predicate. Defaults to
+        chunks no larger than :attr:`eager_size`. See :meth:`load_eagerly`.
+    :param int block_size: How much of the file to read at once while decoding
+        headers, or ``0`` to read each field directly.
+    :param include: The groups to parse; a collection of tags, or a
+        ``func(tag)`` predicate. Other groups are skipped with one seek past
+        their end, and so the file must support ``seek(offset, whence)``.
+        Groups nested within included groups must also be included.
+
+    """
+
+    #: The largest chunk which is read immediately by lazy parsers when not
+    #: given an explicit ``eager`` policy; seeking past something this small
+    #: isn't any cheaper than reading it.
+    eager_size = 256
+
+    def __init__(self, file, lazy=False, eager=None, block_size=65536, include=None):
+        super(Parser, self).__init__()
+
+        self._file = file
+        self._reader = _Reader(file, block_size)
+        self._is_mmap = isinstance(file, _mmap.mmap)
+        self._lazy = lazy
+        if eager is None or callable(eager):
+            self._eager = eager
+        else:
+            tags = frozenset(eager)
+            self._eager = lambda tag, size: tag in tags
+        if include is None or callable(include):
+            self._include = include
+        else:
+            self._include = frozenset(include).__contains__
+        self._group_stack = []
+        self._is_64bit = None
+        self._header = None
+
+        self.children = []
+
+    @classmethod
+    def from_path(cls, path, mmap=False, **kwargs):
+        """Create a parser for the file at the given path.
+
+        :param str path: The file to parse.
+        :param bool mmap: Memory-map the file so that :attr:`Chunk.data` is a
+            ``buffer`` into the mapping instead of a copy read from the file.
+            Nothing is copied until a chunk is decoded, but the data is only
+            valid until the parser is closed.
+        :param kwargs: Passed to the constructor.
+
+        """
+        fh = open(path, 'rb')
+        if not mmap:
+            return cls(fh, **kwargs)
+        try:
+            map_ = _mmap.mmap(fh.fileno(), 0, access=_mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped; fall back to reading them.
+            return cls(fh, **kwargs)
+        # The mapping holds its own reference to the file.
+        fh.close()
+        return cls(map_, **kwargs)
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def is_64bit(self):
+        """Whether the file has 64-bit headers, or ``None`` until the first node is read.
+
+        Node offsets are of their size fields, which are 8 bytes in 64-bit
+        files and 4 bytes otherwise.
+
+        """
+        return self._is_64bit
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            for x in child.walk():
+                yield x
+
+    def pprint(self, data, _indent=-1):
+        """Print a structured representation of the file to stdout."""
+        for child in self.children:
+            child.pprint(data, _indent=_indent + 1)
+
+    def load_eagerly(self, tag, size):
+        """Should a lazy parser read the given chunk while parsing?
+
+        Override this (or pass ``eager`` to the constructor) to change which
+        chunks are loaded up front.
+
+        """
+        if self._eager is not None:
+            return self._eager(tag, size)
+        return size <= self.eager_size
+
+    def _read_at(self, offset, size):
+        # This goes around the reader, so it must leave the file where it was.
+        pos = self._file.tell()
+        try:
+            self._file.seek(offset)
+            return self._file.read(size)
+        finally:
+            self._file.seek(pos)
+
+    def parse_next(self):
+        """Parse to the next :class:`Group` or :class:`Chunk`, returning it.
+
+        This is useful when you want to head the headers of a file without
+        loading its entire contents into memory (especially when ``lazy``).
+
+        """
+        while True:
+            self._pop_groups()
+            node = self._read_node()
+            if node is not _skipped:
+                break
+
+        if node is not None:
+            # Add it as a child of the current group.
+            (node.parent or self).add_child(node)
+        return node
+
+    def _pop_groups(self):
+        """Pop (and return) all groups on the stack which we have read past.
+
+        Anything left in a group that is too small for a header is the padding
+        of the group (e.g. 64-bit groups, whose 4 byte tags leave them 4 bytes
+        short of their alignment), which is skipped.
+
+        """
+        popped = []
+        stack = self._group_stack
+        reader = self._reader
+        pos = reader.tell()
+        while stack and stack[-1].end - pos < self._header.size:
+            group = stack.pop(-1)
+            if group.end > pos:
+                pos = group.end
+                reader.seek(pos)
+            popped.append(group)
+        return popped
+
+    def _read_node(self):
+        """Read the next node, without adding it to the graph.
+
+        The node's parent is set to the current group (or ``None`` at the top
+        level), and groups are pushed onto the group stack. Groups which are
+        not included are seeked past, and ``_skipped`` is returned.
+
+        """
+
+        reader = self._reader
+
+        if self._is_64bit is None:
+            tag = reader.peek(4)
+            if not tag:
+                return
+            if tag == 'FOR8':
+                self._is_64bit = True
+                self._header = _header_64
+            elif tag == 'FOR4':
+                self._is_64bit = False
+                self._header = _header_32
+            else:
+                raise ValueError('Invalid magic tag.', tag)
+
+        # Read a tag and size from the file. This is the hot path, so decode
+        # straight from the reader's buffer when the header is in it.
+        header = self._header
+        pos = reader._pos
+        if pos + header.size <= len(reader._buf):
+            tag, size = header.unpack_from(reader._buf, pos)
+            reader._pos = pos = pos + header.size
+            pos += reader._buf_start
+        else:
+            header = reader.unpack(header)
+            if header is None:
+                return
+            tag, size = header
+            pos = reader.tell()
+
+        # Offsets are of the size field.
+        offset = pos - (8 if self._is_64bit else 4)
+
+        parent = self._group_stack[-1] if self._group_stack else None
+
+        if tag in _group_tags:
+
+            group_tag = reader.read(4)
+
+            group = Group(group_tag, tag, size, offset)
+            group.parent = parent
+
+            # The size counts from the end of the size field.
+            group.end = pos + size + _get_padding(size, group.alignment)
+
+            if self._include is not None and not self._include(group_tag):
+                reader.seek(group.end)
+                return _skipped
+
+            self._group_stack.append(group)
+
+            return group
+
+        else:
+
+            if self._is_mmap:
+                chunk = Chunk(tag, buffer(self._file, pos, size), offset)
+                reader.seek(size, 1)
+            elif self._lazy and not self.load_eagerly(tag, size):
+                loader = functools.partial(self._read_at, pos, size)
+                chunk = LazyChunk(tag, size, loader, offset)
+                reader.seek(size, 1)
+            else:
+                chunk = Chunk(tag, reader.read(size), offset)
+
+            assert parent, 'Data chunk outside of group.'
+            chunk.parent = parent
+
+            # Cleanup padding.
+            padding = _get_padding(size, parent.alignment)
+            if padding:
+                reader.read(padding)
+
+            return chunk
+
+    def parse_all(self):
+        """Parse the entire (remaining) file."""
+        while self.parse_next() is not None:
+            pass
+
+
+class IterParser(Parser):
+
+    """A :class:`Parser` which generates events instead of building a graph.
+
+    Iterating yields ``(event, node)`` tuples; ``("start", group)`` and
+    ``("end", group)`` surround the events of the group's children, and data
+    nodes yield ``("chunk", chunk)``. Nodes know their ``parent`` group, but
+    are not added to its children, so memory use does not grow with the file.
+
+    :param tags: Only generate events for nodes with these tags.
+
+    Other arguments are as for :class:`Parser`.
+
+    """
+
+    def __init__(self, file, tags=None, **kwargs):
+        super(IterParser, self).__init__(file, **kwargs)
+        self._tags = None if tags is None else frozenset(tags)
+        self._events = self._iter_events()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return next(self._events)
+
+    def skip(self):
+        """Skip the rest of the most recently started group.
+
+        The ``"end"`` event of the group is still generated.
+
+        """
+        self._reader.seek(self._group_stack[-1].end)
+
+    def _iter_events(self):
+        tags = self._tags
+        while True:
+            for group in self._pop_groups():
+                if tags is None or group.tag in tags:
+                    yield 'end', group
+            node = self._read_node()
+            if node is None:
+                return
+            if node is _skipped:
+                continue
+            if tags is None or node.tag in tags:
+                yield ('start' if isinstance(node, Group) else 'chunk'), node
+
+
+def iterparse(file, tags=None, **kwargs):
+    """Iterate over ``(event, node)`` tuples of a binary file.
+
+    :param file: A path, or a file-like object.
+    :param tags: Only generate events for nodes with these tags.
+    :param kwargs: Passed to the :class:`IterParser`.
+    :returns: An :class:`IterParser`, which may be told to :meth:`~IterParser.skip`
+        the rest of the current group::
+
+            events = iterparse(path)
+            for event, node in events:
+                if event == 'start' and node.tag != 'HEAD':
+                    events.skip()
+
+    """
+    if isinstance(file, basestring):
+        return IterParser.from_path(file, tags=tags, **kwargs)
+    return IterParser(file, tags=tags, **kwargs)
+
+
+def parse(input_):
+    parser = Parser(input_)
+    parser.parse_all()
+    return parser
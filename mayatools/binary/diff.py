@@ -0,0 +1,193 @@
+"""Structural differences between two binary files.
+
+Every node is hashed bottom-up, the hash of a group covering those of its
+children, so identical subtrees are identified by their hashes alone. Nodes
+are keyed by the names in their ``CREA`` chunks (or, for groups which are
+not nested in a node, their tag) so that the differences are reported in
+terms of the scene.
+
+Run as ``python -m mayatools.binary.diff a.mb b.mb``; see ``--help``.
+
+"""
+
+import collections
+import difflib
+import hashlib
+import struct
+import sys
+from optparse import OptionParser
+
+from .core import format_tag, iterparse
+
+
+#: A node recorded by :func:`digest`. ``children`` is the concatenated entries
+#: of its children: the 4 byte tag, ``"c"``, ``"g"``, or ``"o"`` for chunks,
+#: groups, and nested nodes respectively, and the 20 byte digest.
+NodeDigest = collections.namedtuple('NodeDigest', ('key', 'tag', 'digest', 'children'))
+
+# The tag, kind, and digest of a child.
+_entry_size = 25
+
+
+def get_crea_key(data):
+    """Get the DAG-style ``parent|name`` of a ``CREA`` chunk's data, or ``None``."""
+    parts = str(data).split('\0')
+    name = parts[0][1:]
+    if not name:
+        return
+    parent = parts[1] if len(parts) > 1 else ''
+    return '%s|%s' % (parent, name) if parent else name
+
+
+def digest(path):
+    """Hash every node of a file in one pass.
+
+    Chunks are hashed on their tag, size, and data. Groups are hashed on their
+    type, tag, and the hashes of their children.
+
+    Nodes (groups whose first child is a ``CREA``) and the groups which are not
+    nested within one (e.g. the ``HEAD``) are recorded, keyed by the node name
+    or ``<TAG>`` respectively, with a ``#N`` suffix for repeated keys.
+
+    :param str path: The binary file.
+    :returns: An ordered dict of :class:`NodeDigest`, by key.
+
+    """
+
+    records = collections.OrderedDict()
+
+    # Frames are [group, key, child entries].
+    stack = []
+    named_depth = 0
+
+    # Chunk data are slices of the mapping, so they are hashed without copies.
+    events = iterparse(path, mmap=True)
+    try:
+        for event, node in events:
+
+            if event == 'start':
+                stack.append([node, None, []])
+
+            elif event == 'chunk':
+                frame = stack[-1]
+                if not frame[2] and node.tag == 'CREA':
+                    frame[1] = get_crea_key(node.data)
+                    if frame[1] is not None:
+                        named_depth += 1
+                hash_ = hashlib.sha1(node.tag)
+                hash_.update(struct.pack('>Q', node.size))
+                hash_.update(node.data)
+                frame[2].append(node.tag + 'c' + hash_.digest())
+
+            else:
+                group, key, entries = stack.pop()
+                if key is not None:
+                    named_depth -= 1
+
+                children = ''.join(entries)
+                hash_ = hashlib.sha1(group.type + group.tag)
+                hash_.update(children)
+                group_digest = hash_.digest()
+
+                kind = 'g'
+                if key is not None or not named_depth:
+                    kind = 'o'
+                    key = key or '<%s>' % format_tag(group.tag)
+                    unique_key = key
+                    i = 1
+                    while unique_key in records:
+                        i += 1
+                        unique_key = '%s#%d' % (key, i)
+                    records[unique_key] = NodeDigest(unique_key, group.tag, group_digest, children)
+
+                if stack:
+                    stack[-1][2].append(group.tag + kind + group_digest)
+
+        if stack:
+            raise ValueError('Truncated group %r.' % stack[-1][0].tag)
+
+    finally:
+        events.close()
+
+    return records
+
+
+def _changed_tags(a, b):
+    """Which tags of the children of two nodes differ, excluding nested nodes."""
+    # Nested nodes are reported on their own.
+    a = [e for e in (a[i:i + _entry_size] for i in xrange(0, len(a), _entry_size)) if e[4] != 'o']
+    b = [e for e in (b[i:i + _entry_size] for i in xrange(0, len(b), _entry_size)) if e[4] != 'o']
+    tags = []
+    for op, a1, a2, b1, b2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if op == 'equal':
+            continue
+        for entry in a[a1:a2] + b[b1:b2]:
+            if entry[:4] not in tags:
+                tags.append(entry[:4])
+    return tags
+
+
+def diff(path_a, path_b):
+    """Compare the nodes of two files.
+
+    Nodes with identical hashes are not compared any further. Nodes which
+    only differ in the nodes nested within them are not reported as changed.
+
+    :returns: ``(changed, added, removed)``; ``changed`` is a list of
+        ``(key, tags)`` with the tags of the differing children of the node,
+        and the others are lists of keys.
+
+    """
+
+    a = digest(path_a)
+    b = digest(path_b)
+
+    changed = []
+    removed = []
+    for key, node_a in a.iteritems():
+        node_b = b.get(key)
+        if node_b is None:
+            removed.append(key)
+        elif node_a.digest != node_b.digest:
+            tags = _changed_tags(node_a.children, node_b.children)
+            if tags or node_a.tag != node_b.tag:
+                changed.append((key, tags))
+
+    added = [key for key in b if key not in a]
+
+    return changed, added, removed
+
+
+def main():
+
+    opt_parser = OptionParser(usage='%prog [options] A B')
+    opt_parser.add_option('-q', '--quiet', action='store_true',
+        help='only report via the exit status')
+    opts, args = opt_parser.parse_args()
+
+    if len(args) != 2:
+        opt_parser.error('two files are required')
+
+    try:
+        changed, added, removed = diff(*args)
+    except (IOError, ValueError) as e:
+        print >> sys.stderr, e
+        exit(2)
+
+    if not opts.quiet:
+        for key in removed:
+            print '-', key
+        for key in added:
+            print '+', key
+        for key, tags in changed:
+            if tags:
+                print '~', key, '(%s)' % ', '.join(format_tag(tag).rstrip() for tag in tags)
+            else:
+                print '~', key
+
+    if changed or added or removed:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
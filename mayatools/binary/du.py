@@ -0,0 +1,170 @@
+"""Attribute the bytes of a binary scene to the nodes which created them.
+
+Every node of a ``.mb`` is a group whose tag is the node type and whose first
+child is a ``CREA`` chunk naming it. Each byte of the file is attributed to the
+innermost such group which contains it; groups outside of any node (e.g. the
+``HEAD``) are accounted for under their own tag, without a name.
+
+Run as ``python -m mayatools.binary.du scene.mb``; see ``--help``.
+
+"""
+
+import collections
+import json
+import sys
+from optparse import OptionParser
+
+from .core import format_tag, iterparse
+
+
+#: The bytes attributed to one node by :func:`du`. ``size`` is what the node
+#: takes itself, and ``total`` includes the nodes nested within it. ``name``
+#: and ``namespace`` are ``None`` for groups that are not nodes.
+NodeUsage = collections.namedtuple('NodeUsage', ('name', 'type', 'namespace', 'offset', 'size', 'total'))
+
+
+def get_namespace(name):
+    """Get the namespace of a node name, or ``''`` for the root namespace."""
+    return name.rpartition(':')[0]
+
+
+def du(path):
+    """Attribute every byte of a file to the node which created it.
+
+    Only the headers and ``CREA`` chunks are read. The sizes of the returned
+    records sum to the size of the file.
+
+    :param str path: The binary file.
+    :returns: A list of :class:`NodeUsage`, in the order they end in the file.
+
+    """
+
+    usage = []
+
+    # Frames are [group, name, bytes claimed by nested records, has children].
+    stack = []
+    named_depth = 0
+
+    events = iterparse(path, lazy=True, eager=('CREA', ))
+    try:
+        for event, node in events:
+
+            if event == 'start':
+                if stack:
+                    stack[-1][3] = True
+                stack.append([node, None, 0, False])
+
+            elif event == 'chunk':
+                frame = stack[-1]
+                if not frame[3] and node.tag == 'CREA':
+                    frame[1] = str(node.data).split('\0')[0][1:] or None
+                    if frame[1] is not None:
+                        named_depth += 1
+                frame[3] = True
+
+            else:
+                group, name, claimed, _ = stack.pop()
+                if name is not None:
+                    named_depth -= 1
+
+                # The group runs from its type tag to the end of its padding.
+                offset = group.start - (8 if events.is_64bit else 4)
+                total = group.end - offset
+
+                # Groups claim their bytes if they are nodes, or if there is no
+                # node above them to claim them instead.
+                if name is not None or not named_depth:
+                    namespace = None if name is None else get_namespace(name)
+                    usage.append(NodeUsage(name, group.tag, namespace, offset, total - claimed, total))
+                    claimed = total
+                if stack:
+                    stack[-1][2] += claimed
+
+        # Groups left open ran past the end of the file.
+        if stack:
+            raise ValueError('Truncated group %r.' % stack[-1][0].tag)
+
+    finally:
+        events.close()
+
+    return usage
+
+
+def aggregate(usage, key):
+    """Total the bytes of :func:`du` records by the given field.
+
+    :param str key: The field of :class:`NodeUsage` to group by, e.g. ``"type"``.
+    :returns: A list of ``(value, count, size)``, largest first.
+
+    """
+    totals = {}
+    for record in usage:
+        value = getattr(record, key)
+        count, size = totals.get(value, (0, 0))
+        totals[value] = (count + 1, size + record.size)
+    return sorted(((value, count, size) for value, (count, size) in totals.iteritems()), key=lambda x: (-x[2], x[0]))
+
+
+def main():
+
+    opt_parser = OptionParser(usage='%prog [options] SCENE [...]')
+    opt_parser.add_option('-n', '--top', type='int', default=20,
+        help='how many nodes, types, and namespaces to report')
+    opt_parser.add_option('--json', action='store_true',
+        help='emit JSON instead of tables')
+    opts, args = opt_parser.parse_args()
+
+    if not args:
+        opt_parser.error('no scenes given')
+
+    results = []
+    failed = False
+    for path in args:
+
+        try:
+            usage = du(path)
+        except (IOError, ValueError) as e:
+            failed = True
+            print >> sys.stderr, '%s: %s' % (path, e)
+            continue
+
+        size = sum(record.size for record in usage)
+        nodes = sorted(usage, key=lambda x: -x.size)[:opts.top]
+        types = aggregate(usage, 'type')[:opts.top]
+        namespaces = aggregate(usage, 'namespace')[:opts.top]
+
+        if opts.json:
+            results.append(dict(
+                path=path,
+                size=size,
+                nodes=[dict(record._asdict(), type=format_tag(record.type)) for record in nodes],
+                types=[dict(type=format_tag(type_), count=count, size=bytes_) for type_, count, bytes_ in types],
+                namespaces=[dict(namespace=ns, count=count, size=bytes_) for ns, count, bytes_ in namespaces],
+            ))
+            continue
+
+        print '%s: %d bytes in %d nodes' % (path, size, len(usage))
+        print '    Nodes:'
+        for record in nodes:
+            print '        %12d %5.1f%%  %-6s %s' % (
+                record.size, 100.0 * record.size / (size or 1), format_tag(record.type),
+                record.name if record.name is not None else '-',
+            )
+        print '    Types:'
+        for type_, count, bytes_ in types:
+            print '        %12d %5.1f%%  %-10s %8d nodes' % (bytes_, 100.0 * bytes_ / (size or 1), format_tag(type_), count)
+        print '    Namespaces:'
+        for namespace, count, bytes_ in namespaces:
+            namespace = '-' if namespace is None else (namespace or ':')
+            print '        %12d %5.1f%%  %-20s %8d nodes' % (bytes_, 100.0 * bytes_ / (size or 1), namespace, count)
+
+    if opts.json:
+        json.dump(results, sys.stdout, indent=4, sort_keys=True)
+        sys.stdout.write('\n')
+
+    if failed:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+import array
+import functools
+import hashlib
+import marshal
+import os
+import sys
+
+from .core import Group, LazyChunk, iterparse
+from .selector import compile_selector
+
+
+# Offsets and sizes may be beyond 4GB, but unsigned longs are only 32-bit on
+# some platforms. Doubles represent integers exactly up to 2**53, so fall back
+# to them if we must.
+_offset_typecode = 'L' if array.array('L').itemsize >= 8 else 'd'
+
+# Arrays are stored raw, so they can only be loaded on similar platforms.
+_platform = (sys.byteorder, _offset_typecode, array.array('l').itemsize)
+
+_null_type = '\0' * 4
+
+
+def get_default_cache_dir():
+    """The directory that indices are kept in unless told otherwise.
+
+    This is ``$MAYATOOLS_BINARY_INDEX_DIR``, or else ``mayatools/binary-index``
+    in the user's cache directory (``$XDG_CACHE_HOME``, or ``~/.cache``).
+
+    """
+    cache_dir = os.environ.get('MAYATOOLS_BINARY_INDEX_DIR')
+    if cache_dir:
+        return cache_dir
+    root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(root, 'mayatools', 'binary-index')
+
+
+def get_index_path(path, cache_dir=None, sidecar=None):
+    """Get the path that the :class:`Index` of the given file is stored at.
+
+    Indices are kept out of the way of the files by default, so that reading
+    a directory of files does not add to it.
+
+    :param str path: The binary file.
+    :param str cache_dir: A directory to keep indices in, keyed by the hash of
+        the file's path. Defaults to :func:`get_default_cache_dir`.
+    :param bool sidecar: Keep the index in a hidden file next to the binary
+        file instead, unless a ``cache_dir`` is given. Defaults to whether
+        ``$MAYATOOLS_BINARY_INDEX_SIDECAR`` is set (and not ``"0"``).
+
+    """
+    path = os.path.abspath(path)
+    if sidecar is None:
+        sidecar = os.environ.get('MAYATOOLS_BINARY_INDEX_SIDECAR', '0') not in ('', '0')
+    if sidecar and not cache_dir:
+        directory, name = os.path.split(path)
+        return os.path.join(directory, '.%s.idx' % name)
+    cache_dir = cache_dir or get_default_cache_dir()
+    return os.path.join(cache_dir, hashlib.sha1(path).hexdigest() + '.idx')
+
+
+class Index(object):
+
+    """A table of contents of a binary file.
+
+    Records the tag, group type, offset and size of every node, and the
+    position of its parent in the table, so that nodes may be found without
+    parsing the file, and their data read with a single seek.
+
+    Nodes are identified by their position in the table, which is the order
+    that they appear in the file. Offsets are of the first byte after the
+    node's size field, so the data of a node is ``file[offset:offset + size]``
+    (which starts with the group tag for groups).
+
+    Indexes are usually retrieved via :meth:`for_path`, which caches them on
+    disk keyed by the path, size and modification time of the file.
+
+    """
+
+    #: Bump this whenever the stored format changes to invalidate old indices.
+    format_version = 1
+
+    def __init__(self, path=None, file_size=None, mtime=None, is_64bit=False):
+
+        self.path = path
+        self.file_size = file_size
+        self.mtime = mtime
+        self.is_64bit = is_64bit
+
+        #: Tags of every node; 4 characters each.
+        self.tags = array.array('c')
+
+        #: Group types of every node; 4 characters each, ``NULL`` for chunks.
+        self.types = array.array('c')
+
+        self.offsets = array.array(_offset_typecode)
+        self.sizes = array.array(_offset_typecode)
+
+        #: Index of the parent of every node, or ``-1`` at the top level.
+        self.parents = array.array('l')
+
+        self._by_tag = None
+        self._file = None
+
+    @classmethod
+    def build(cls, path):
+        """Build the index of the given file by walking its headers."""
+
+        stat = os.stat(path)
+        self = cls(os.path.abspath(path), stat.st_size, stat.st_mtime)
+
+        # Nothing but the headers is read, and nothing is retained.
+        events = iterparse(path, lazy=True, eager=())
+        try:
+            stack = []
+            for event, node in events:
+                parent = stack[-1] if stack else -1
+                if event == 'start':
+                    stack.append(self.add(node.tag, node.type, node.start, node.size, parent))
+                elif event == 'end':
+                    stack.pop()
+                else:
+                    self.add(node.tag, None, node.offset, node.size, parent)
+            self.is_64bit = bool(events.is_64bit)
+        finally:
+            events.close()
+
+        # The parser gave us the offsets of the size fields.
+        int_size = 8 if self.is_64bit else 4
+        for i in xrange(len(self)):
+            self.offsets[i] += int_size
+
+        return self
+
+    @classmethod
+    def for_path(cls, path, cache_dir=None, sidecar=None):
+        """Get the index of the given file, from the cache if it is current.
+
+        A newly built index is saved to the cache. Failing to do so (e.g. due to
+        permissions) is not an error.
+
+        :param str path: The binary file.
+        :param str cache_dir: See :func:`get_index_path`.
+        :param bool sidecar: See :func:`get_index_path`.
+
+        """
+        path = os.path.abspath(path)
+        index_path = get_index_path(path, cache_dir, sidecar)
+        stat = os.stat(path)
+        try:
+            index = cls.load(index_path)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            index = None
+        if index is not None and (
+            index.path == path and
+            index.file_size == stat.st_size and
+            index.mtime == stat.st_mtime
+        ):
+            return index
+
+        index = cls.build(path)
+        try:
+            index.save(index_path)
+        except (IOError, OSError):
+            pass
+        return index
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved via :meth:`save`.
+
+        :raises ValueError: if it was saved by an incompatible version or platform.
+
+        """
+        with open(path, 'rb') as fh:
+            raw = marshal.load(fh)
+        if raw[:2] != (cls.format_version, _platform):
+            raise ValueError('incompatible index')
+        self = cls(*raw[2:6])
+        for name, value in zip(('tags', 'types', 'offsets', 'sizes', 'parents'), raw[6:]):
+            getattr(self, name).fromstring(value)
+        return self
+
+    def save(self, path):
+        """Save the index, atomically replacing anything at the given path."""
+        raw = (
+            self.format_version, _platform,
+            self.path, self.file_size, self.mtime, self.is_64bit,
+            self.tags.tostring(), self.types.tostring(),
+            self.offsets.tostring(), self.sizes.tostring(),
+            self.parents.tostring(),
+        )
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as fh:
+                marshal.dump(raw, fh)
+            os.rename(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def __len__(self):
+        return len(self.parents)
+
+    def add(self, tag, type_, offset, size, parent=-1):
+        """Append a node to the index, returning its position."""
+        self.tags.fromstring(tag)
+        self.types.fromstring(type_ or _null_type)
+        self.offsets.append(offset)
+        self.sizes.append(size)
+        self.parents.append(parent)
+        self._by_tag = None
+        return len(self) - 1
+
+    def tag(self, i):
+        return self.tags[4 * i:4 * i + 4].tostring()
+
+    def type(self, i):
+        """The group type of the given node, or ``None`` if it is a chunk."""
+        type_ = self.types[4 * i:4 * i + 4].tostring()
+        return None if type_ == _null_type else type_
+
+    def is_group(self, i):
+        return self.type(i) is not None
+
+    def offset(self, i):
+        return int(self.offsets[i])
+
+    def size(self, i):
+        return int(self.sizes[i])
+
+    def parent(self, i):
+        return self.parents[i]
+
+    def positions(self, tag, within=None):
+        """List the positions of all nodes with the given tag.
+
+        :param str tag: The tag to find.
+        :param int within: Only return descendants of the node at this position.
+
+        """
+        if self._by_tag is None:
+            by_tag = {}
+            for i in xrange(len(self)):
+                by_tag.setdefault(self.tag(i), array.array('l')).append(i)
+            self._by_tag = by_tag
+        positions = self._by_tag.get(tag, ())
+        if within is None:
+            return list(positions)
+        return [i for i in positions if self.is_descendant(i, within)]
+
+    def is_descendant(self, i, ancestor):
+        # Descendants always follow their ancestors, which lets us stop early.
+        while i > ancestor:
+            i = self.parents[i]
+        return i == ancestor
+
+    def read(self, i):
+        """Read the raw data of the given node from the file."""
+        if self._file is None:
+            self._file = open(self.path, 'rb')
+        self._file.seek(self.offset(i))
+        return self._file.read(self.size(i))
+
+    def node(self, i):
+        """Get a (childless) :class:`Group`, or a :class:`LazyChunk`.
+
+        Their offsets follow the :class:`Parser`, and so are of their size fields.
+
+        """
+        start = self.offset(i) - (8 if self.is_64bit else 4)
+        type_ = self.type(i)
+        if type_ is None:
+            return LazyChunk(self.tag(i), self.size(i), functools.partial(self.read, i), start)
+        else:
+            return Group(self.tag(i), type_, self.size(i), start)
+
+    def find(self, tag, within=None):
+        """Iterate across all nodes with a given tag; see :meth:`Node.find`."""
+        for i in self.positions(tag, within):
+            yield self.node(i)
+
+    def find_one(self, tag, *args, **kwargs):
+        """Find the first node with the given tag; see :meth:`Node.find_one`."""
+        for node in self.find(tag, kwargs.pop('within', None)):
+            return node
+        if args:
+            return args[0]
+        raise KeyError(tag)
+
+    def select(self, selector, within=None):
+        """Iterate across all nodes matching a selector; see :meth:`Node.select`.
+
+        :param int within: Select relative to the node at this position,
+            instead of the top level of the file.
+
+        """
+        node = lambda i: None if i is None else self.node(i)
+        for match in compile_selector(selector).select_positions(self, within):
+            if isinstance(match, tuple):
+                yield tuple(node(i) for i in match)
+            else:
+                yield node(match)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
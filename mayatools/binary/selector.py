@@ -0,0 +1,205 @@
+"""Path-like selection of nodes by their tags.
+
+A selector is a ``/`` separated path of steps relative to a node, each of
+which is one of:
+
+* a tag, which matches children with that tag (e.g. ``MYCH/CHNM``);
+* ``*``, which matches any child;
+* ``**``, which matches any number (including zero) of levels of descendants
+  (e.g. ``**/FBCA`` for every ``FBCA`` at any depth).
+
+The last step may join several tags with ``+`` to select siblings together;
+``MYCH/CHNM+SIZE+FBCA`` selects ``(CHNM, SIZE, FBCA)`` tuples, made of each
+``CHNM`` and the first ``SIZE`` and ``FBCA`` which follow it before the next
+``CHNM``, or ``None`` where there aren't any.
+
+Selectors are compiled once (and cached), and evaluated in a single pass over
+either a parsed graph (via :meth:`Node.select`) or an :class:`Index` (via
+:meth:`Index.select`).
+
+"""
+
+
+import itertools
+
+
+_deep = '**'
+_any = '*'
+
+_cache = {}
+
+
+def compile_selector(pattern):
+    """Get the :class:`Selector` for a pattern, compiling it if it is new."""
+    if isinstance(pattern, Selector):
+        return pattern
+    selector = _cache.get(pattern)
+    if selector is None:
+        selector = _cache[pattern] = Selector(pattern)
+    return selector
+
+
+class Selector(object):
+
+    """A compiled selector; see the :mod:`module <mayatools.binary.selector>`.
+
+    :param str pattern: The selector to compile.
+    :raises ValueError: if the pattern is malformed.
+
+    """
+
+    def __init__(self, pattern):
+
+        self.pattern = pattern
+
+        steps = pattern.strip('/').split('/')
+        if not pattern.strip('/') or any(not step for step in steps):
+            raise ValueError('empty step in selector %r' % pattern)
+
+        #: The tags of siblings selected along with each match.
+        self.siblings = ()
+        if '+' in steps[-1]:
+            tags = steps[-1].split('+')
+            if any(tag in (_deep, _any, '') for tag in tags):
+                raise ValueError('siblings must be tags in selector %r' % pattern)
+            steps[-1] = tags[0]
+            self.siblings = tuple(tags[1:])
+        if steps[-1] == _deep:
+            raise ValueError('selector %r cannot end with %s' % (pattern, _deep))
+
+        self.steps = tuple(steps)
+
+        # The states which can be reached without consuming a node (i.e. by
+        # skipping "**"), from each state.
+        self._closures = []
+        for i in xrange(len(steps)):
+            closure = [i]
+            while steps[closure[-1]] == _deep:
+                closure.append(closure[-1] + 1)
+            self._closures.append(tuple(closure))
+
+        self._initial = (0, )
+        self._transitions = {}
+
+    def _advance(self, states, tag):
+        """Get the states of a node with the given tag, from those of its parent.
+
+        The final state (``len(steps)``) means the node is selected.
+
+        """
+        key = (states, tag)
+        try:
+            return self._transitions[key]
+        except KeyError:
+            pass
+        steps = self.steps
+        next_states = set()
+        for state in states:
+            for i in self._closures[state]:
+                step = steps[i]
+                if step == _deep:
+                    next_states.add(i)
+                elif step == _any or step == tag:
+                    next_states.add(i + 1)
+        next_states = tuple(sorted(next_states))
+        self._transitions[key] = next_states
+        return next_states
+
+    def _pair(self, first, following, get_tag):
+        """Build the tuple of a match, and the siblings which follow it."""
+        first_tag = get_tag(first)
+        found = dict.fromkeys(self.siblings)
+        remaining = len(found)
+        for sibling in following:
+            tag = get_tag(sibling)
+            if tag == first_tag:
+                break
+            if tag in found and found[tag] is None:
+                found[tag] = sibling
+                remaining -= 1
+                if not remaining:
+                    break
+        return (first, ) + tuple(found[tag] for tag in self.siblings)
+
+    def select(self, node):
+        """Iterate over the matching descendants of a graph :class:`Node`, in order."""
+
+        final = len(self.steps)
+        get_tag = lambda node: node.tag
+
+        # Depth-first, with a stack of (children, next index, states).
+        stack = [(node.children, 0, self._initial)]
+        while stack:
+
+            children, i, states = stack[-1]
+            if i == len(children):
+                stack.pop()
+                continue
+            stack[-1] = (children, i + 1, states)
+
+            child = children[i]
+            child_states = self._advance(states, child.tag)
+            if not child_states:
+                continue
+
+            if child_states[-1] == final:
+                if self.siblings:
+                    yield self._pair(child, itertools.islice(children, i + 1, None), get_tag)
+                else:
+                    yield child
+                child_states = child_states[:-1]
+
+            grandchildren = getattr(child, 'children', None)
+            if child_states and grandchildren:
+                stack.append((grandchildren, 0, child_states))
+
+    def select_positions(self, index, within=None):
+        """Iterate over the positions of the matching nodes of an :class:`Index`.
+
+        :param int within: Select relative to the node at this position,
+            instead of the top level of the file.
+
+        """
+
+        final = len(self.steps)
+        parents = index.parents
+        get_tag = index.tag
+
+        root = -1 if within is None else within
+
+        # The states of the groups which may contain matches.
+        states = {root: self._initial}
+
+        for i in xrange(root + 1, len(index)):
+
+            parent = parents[i]
+            if parent < root:
+                # Nodes are in document order, so we have left the root.
+                break
+            parent_states = states.get(parent)
+            if parent_states is None:
+                continue
+
+            child_states = self._advance(parent_states, get_tag(i))
+            if not child_states:
+                continue
+
+            if child_states[-1] == final:
+                if self.siblings:
+                    yield self._pair(i, self._iter_following(index, i), get_tag)
+                else:
+                    yield i
+                child_states = child_states[:-1]
+
+            if child_states and index.is_group(i):
+                states[i] = child_states
+
+    def _iter_following(self, index, i):
+        """Iterate over the positions of the siblings following a node."""
+        parents = index.parents
+        parent = parents[i]
+        for j in xrange(i + 1, len(index)):
+            if parents[j] == parent:
+                yield j
+            elif parents[j] < parent:
+                return
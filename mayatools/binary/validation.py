@@ -0,0 +1,236 @@
+"""Detect truncated or corrupt binary files without parsing them.
+
+Run as ``python -m mayatools.binary.validation DIRECTORY [...]`` to check every
+``.mc`` within the given directories (or files), optionally moving the bad
+ones aside; see ``--help``.
+
+"""
+
+import fnmatch
+import itertools
+import multiprocessing
+import os
+import sys
+from optparse import OptionParser
+
+from .core import (
+    _Reader, _get_padding, _get_tag_alignment, _group_tags,
+    _header_32, _header_64,
+)
+from .index import get_index_path
+
+
+class ValidationError(ValueError):
+
+    """Where, and how, a file is invalid; as returned by :func:`validate`.
+
+    :param str path: The file.
+    :param int offset: The offset of the offending node (or byte).
+    :param str message: What is wrong with it.
+    :param str tag: The tag of the offending node, if there is one.
+
+    """
+
+    def __init__(self, path, offset, message, tag=None):
+        super(ValidationError, self).__init__(path, offset, message, tag)
+        self.path = path
+        self.offset = offset
+        self.message = message
+        self.tag = tag
+
+    def __str__(self):
+        tag = ' in %r' % self.tag if self.tag is not None else ''
+        return '%s at 0x%x%s' % (self.message, self.offset, tag)
+
+
+def validate(path, block_size=4096):
+    """Check that the structure of a binary file is intact.
+
+    Only the headers are read, seeking past the data of each chunk. Every node
+    (with its padding) must fit within its group, and every group within the
+    file.
+
+    :param str path: The file to check.
+    :param int block_size: How much to read at a time; small, since most of
+        every block is typically seeked past.
+    :returns: ``None`` if the file is valid, or a :class:`ValidationError`.
+    :raises IOError: if the file cannot be read.
+
+    """
+
+    file_size = os.path.getsize(path)
+    if not file_size:
+        return ValidationError(path, 0, 'Empty file')
+
+    with open(path, 'rb') as fh:
+
+        reader = _Reader(fh, block_size)
+
+        magic = reader.peek(4)
+        if magic == 'FOR8':
+            header = _header_64
+        elif magic == 'FOR4':
+            header = _header_32
+        else:
+            return ValidationError(path, 0, 'Invalid magic tag %r' % magic)
+
+        # Groups are (content end, end with padding, alignment, tag).
+        stack = []
+        pos = 0
+
+        while True:
+
+            # Whatever is left that is too small for a header is padding.
+            while stack and stack[-1][0] - pos < header.size:
+                limit, end, alignment, tag = stack.pop()
+                if pos < limit:
+                    return ValidationError(path, pos, 'Trailing %d bytes' % (limit - pos), tag)
+                pos = end
+
+            limit = stack[-1][0] if stack else file_size
+            parent_tag = stack[-1][3] if stack else None
+            if pos == limit:
+                break
+            if limit - pos < header.size:
+                return ValidationError(path, pos, 'Truncated header; %d of %d bytes' % (limit - pos, header.size), parent_tag)
+
+            reader.seek(pos)
+            tag, size = reader.unpack(header)
+            data_pos = pos + header.size
+
+            if tag in _group_tags:
+
+                if size < 4:
+                    return ValidationError(path, pos, 'Group of %d bytes is too small for its tag' % size, parent_tag)
+                alignment = _get_tag_alignment(tag)
+                content_end = data_pos + size
+                end = content_end + _get_padding(size, alignment)
+                if content_end > limit or (stack and end > limit):
+                    return ValidationError(path, pos, '%s group of %d bytes overruns %s by %d bytes' % (
+                        tag, size,
+                        'its group' if stack else 'the file',
+                        max(content_end, end if stack else 0) - limit,
+                    ), parent_tag)
+
+                # The last group in a file may be missing its padding.
+                stack.append((content_end, min(end, file_size), alignment, reader.read(4)))
+                pos = data_pos + 4
+
+            else:
+
+                if not stack:
+                    return ValidationError(path, pos, 'Chunk %r outside of a group' % tag)
+                end = data_pos + size + _get_padding(size, stack[-1][2])
+                if end > limit:
+                    return ValidationError(path, pos, '%r chunk of %d bytes overruns its group by %d bytes' % (
+                        tag, size, end - limit,
+                    ), parent_tag)
+                pos = end
+
+
+def iter_paths(paths, pattern='*.mc', exclude=()):
+    """Iterate across the given files, and those matching a pattern within the given directories.
+
+    :param exclude: Names of directories not to descend into.
+
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for dir_path, dir_names, file_names in os.walk(path):
+            dir_names[:] = sorted(name for name in dir_names if name not in exclude)
+            for file_name in sorted(fnmatch.filter(file_names, pattern)):
+                yield os.path.join(dir_path, file_name)
+
+
+def quarantine(path, directory):
+    """Move a file into the given directory, relative to the file.
+
+    Its :class:`~mayatools.binary.Index` is removed, since it is keyed by the
+    old path and would never be used again.
+
+    :raises OSError: if the file could not be moved.
+
+    """
+    directory = os.path.join(os.path.dirname(path), directory)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    dst_path = os.path.join(directory, os.path.basename(path))
+    if os.path.exists(dst_path):
+        raise OSError('%s already exists' % dst_path)
+    os.rename(path, dst_path)
+    try:
+        os.unlink(get_index_path(path))
+    except OSError:
+        pass
+    return dst_path
+
+
+def _validate_path(path):
+    try:
+        return path, validate(path)
+    except (IOError, OSError) as e:
+        return path, ValidationError(path, 0, str(e))
+
+
+def main():
+
+    opt_parser = OptionParser(usage='%prog [options] PATH [...]')
+    opt_parser.add_option('-p', '--pattern', default='*.mc',
+        help='what to check within directories; defaults to %default')
+    opt_parser.add_option('-j', '--jobs', type='int', default=1,
+        help='check this many files at once')
+    opt_parser.add_option('-Q', '--quarantine', metavar='DIR',
+        help='move bad files into this directory (relative to each bad file)')
+    opt_parser.add_option('-v', '--verbose', action='store_true',
+        help='print good files too')
+    opts, args = opt_parser.parse_args()
+
+    if not args:
+        opt_parser.error('no paths given')
+
+    # Listed up front, so that we don't find what we quarantine.
+    exclude = [opts.quarantine] if opts.quarantine else []
+    paths = list(iter_paths(args, opts.pattern, exclude))
+
+    pool = None
+    if opts.jobs > 1:
+        pool = multiprocessing.Pool(opts.jobs)
+        results = pool.imap(_validate_path, paths, chunksize=16)
+    else:
+        results = itertools.imap(_validate_path, paths)
+
+    bad = stuck = 0
+    try:
+        for path, error in results:
+
+            if error is None:
+                if opts.verbose:
+                    print '%s: OK' % path
+                continue
+
+            bad += 1
+            print '%s: %s' % (path, error)
+
+            if opts.quarantine:
+                try:
+                    quarantine(path, opts.quarantine)
+                except OSError as e:
+                    stuck += 1
+                    print >> sys.stderr, '%s: could not quarantine: %s' % (path, e)
+
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if bad:
+        print >> sys.stderr, '%d bad files' % bad
+        if stuck:
+            print >> sys.stderr, '%d could not be quarantined' % stuck
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
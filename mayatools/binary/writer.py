@@ -0,0 +1,169 @@
+import contextlib
+import struct
+
+from .core import (
+    Group, Node, iterparse, _get_group_type, _get_padding, _get_tag_alignment,
+    _header_32, _header_64, _max_32bit_size,
+)
+
+
+class Writer(object):
+
+    """Streams a binary file, without holding its contents in memory.
+
+    Groups are written by reserving their size field, writing their children
+    as they come, and then seeking back to fill in the size once the group is
+    ended::
+
+        writer = Writer(fh)
+        with writer.group('CACH'):
+            writer.write_chunk('VRSN', '0.1\\0')
+        writer.write(node) # Any existing Node/Group/Chunk.
+
+    Files over 4GB must be written with 64-bit sizes, in which case all groups
+    are written as their 8-aligned equivalents (e.g. ``FOR4`` as ``FOR8``).
+    Since streamed groups are sized after their children have been written,
+    this must be decided up front; :meth:`end_group` and :meth:`write_chunk`
+    raise a ``ValueError`` when something is too large for a 32-bit file
+    rather than silently corrupting it.
+
+    :param file: The file-like object to write to; must support ``write(data)``
+        and ``tell()``, and ``seek(offset, whence)`` to write groups via
+        :meth:`start_group`.
+    :param bool is_64bit: Write 64-bit sizes (and ``FOR8`` groups).
+
+    """
+
+    def __init__(self, file, is_64bit=False):
+        self._file = file
+        self._group_stack = []
+        self.is_64bit = is_64bit
+        self._header = _header_64 if is_64bit else _header_32
+
+    @property
+    def alignment(self):
+        """The alignment of the current group."""
+        return self._group_stack[-1][1] if self._group_stack else 2
+
+    def start_group(self, tag, type_='FOR4'):
+        """Start a group, which all chunks will be written into until it is ended."""
+        type_ = _get_group_type(type_, self.is_64bit)
+        start = self._file.tell()
+        self._file.write(self._header.pack(type_, 0))
+        self._file.write(tag)
+        self._group_stack.append((start, _get_tag_alignment(type_)))
+
+    def end_group(self):
+        """End the current group, patching its size."""
+        start, alignment = self._group_stack.pop()
+        end = self._file.tell()
+        size = end - start - self._header.size
+        if size > _max_32bit_size and not self.is_64bit:
+            raise ValueError('%d byte group is too large for a 32-bit file' % size)
+        # The size is last in the header.
+        size_format = '>Q' if self.is_64bit else '>L'
+        self._file.seek(start + self._header.size - struct.calcsize(size_format))
+        self._file.write(struct.pack(size_format, size))
+        self._file.seek(end)
+        padding = _get_padding(size, alignment)
+        if padding:
+            self._file.write('\0' * padding)
+
+    @contextlib.contextmanager
+    def group(self, tag, type_='FOR4'):
+        """Context manager which starts a group, and ends it on exit."""
+        self.start_group(tag, type_)
+        yield
+        self.end_group()
+
+    def write_chunk(self, tag, data):
+        """Write a chunk into the current group.
+
+        :param str tag: The data type.
+        :param data: The raw data; a ``str``, or anything else exposing the
+            buffer interface (e.g. :class:`array.array` or :class:`numpy.ndarray`
+            already in big-endian order).
+
+        """
+        if not self._group_stack:
+            raise ValueError('Data chunk outside of group.')
+        size = len(buffer(data))
+        if size > _max_32bit_size and not self.is_64bit:
+            raise ValueError('%d byte chunk is too large for a 32-bit file' % size)
+        self._file.write(self._header.pack(tag, size))
+        self._file.write(data)
+        padding = _get_padding(size, self.alignment)
+        if padding:
+            self._file.write('\0' * padding)
+
+    def write(self, node):
+        """Write an existing :class:`Node`, :class:`Group`, or :class:`Chunk`.
+
+        As the sizes of existing nodes are known up front, this does not seek.
+
+        """
+        if isinstance(node, Group):
+            type_ = _get_group_type(node.type, self.is_64bit)
+            alignment = _get_tag_alignment(type_)
+            # The children and the tag, but not the header or padding.
+            size = Node.packed_size(node, self.is_64bit) + 4
+            if size > _max_32bit_size and not self.is_64bit:
+                raise ValueError('%d byte group is too large for a 32-bit file' % size)
+            self._file.write(self._header.pack(type_, size))
+            self._file.write(node.tag)
+            self._group_stack.append((None, alignment))
+            try:
+                for child in node.children:
+                    self.write(child)
+            finally:
+                self._group_stack.pop()
+            padding = _get_padding(size, alignment)
+            if padding:
+                self._file.write('\0' * padding)
+        elif isinstance(node, Node):
+            for child in node.children:
+                self.write(child)
+        else:
+            self.write_chunk(node.tag, node.data)
+
+    def close(self):
+        if self._group_stack:
+            raise ValueError('%d groups have not been ended' % len(self._group_stack))
+        self._file.close()
+
+
+def patch_chunk(path, tag, data):
+    """Replace the data of the first chunk with the given tag, in place.
+
+    Only the headers up to that chunk are read, and only its data is written,
+    so this is much cheaper than rewriting the file (e.g. to change the times
+    of a cache frame). The new data must be the same size as the old.
+
+    :param str path: The binary file to modify.
+    :param str tag: The tag of the chunk to replace.
+    :param str data: The new raw data.
+    :returns: The old raw data.
+    :raises KeyError: if there is no such chunk.
+    :raises ValueError: if the new data is a different size.
+
+    """
+    with open(path, 'r+b') as fh:
+
+        events = iterparse(fh, lazy=True, eager=())
+        for event, node in events:
+            if event == 'chunk' and node.tag == tag:
+                break
+        else:
+            raise KeyError(tag)
+
+        if len(data) != node.size:
+            raise ValueError('%d bytes cannot replace the %d byte %r chunk' % (len(data), node.size, tag))
+
+        # Offsets are of the size field.
+        offset = node.offset + (8 if events.is_64bit else 4)
+        fh.seek(offset)
+        old_data = fh.read(node.size)
+        fh.seek(offset)
+        fh.write(data)
+
+    return old_data
@@ -1,9 +1,17 @@
+import array
 import ast
+import bisect
+import collections
 import copy
 import os
 import re
 import xml.etree.cElementTree as etree
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from .. import binary
 
 
@@ -24,6 +32,8 @@ class Cache(object):
             self.parse_xml()
 
         self._frames = []
+        self._frame_times = None
+        self._frame_starts = None
 
     def free(self):
         for frame in self._frames:
@@ -97,16 +107,91 @@ class Cache(object):
 
     @property
     def frames(self):
+        """All frames of the cache, in order of their start times."""
         if not self._frames:
+            for time, path in self.frame_times:
+                self._frames.append(Frame(self, path))
+        return self._frames
+
+    @property
+    def frame_times(self):
+        """The ``(start_time, path)`` of every frame, sorted by time.
+
+        The times are derived from the file names, so no frames are opened;
+        see :meth:`verify_frame_times`. The list is built once and then cached.
 
-            name_re = re.compile(r'^%sFrame(\d+)(?:Tick(\d))?\.mc$' % re.escape(self.base_name))
+        """
+        if self._frame_times is None:
+            name_re = re.compile(r'^%sFrame(\d+)(?:Tick(\d+))?\.mc$' % re.escape(self.base_name))
+            frame_times = []
             for file_name in os.listdir(self.directory):
                 m = name_re.match(file_name)
                 if m:
-                    frame = Frame(self, os.path.join(self.directory, file_name))
-                    self._frames.append(frame)
-
-        return self._frames
+                    time = int(m.group(1)) * self.time_per_frame + int(m.group(2) or 0)
+                    frame_times.append((time, os.path.join(self.directory, file_name)))
+            frame_times.sort()
+            self._frame_times = frame_times
+            self._frame_starts = [time for time, path in frame_times]
+        return self._frame_times
+
+    def verify_frame_times(self, frame_times=None):
+        """Check that frames start at the times that their names claim.
+
+        :param frame_times: The ``(start_time, path)`` to check; defaults to
+            all of :attr:`frame_times`.
+        :raises ValueError: if the header of any frame disagrees.
+
+        """
+        for time, path in (self.frame_times if frame_times is None else frame_times):
+            frame = Frame(self, path)
+            if frame.start_time != time:
+                raise ValueError('%s starts at %s, but is named for %s' % (path, frame.start_time, time))
+
+    def get_frames_for(self, time):
+        """Get the paths of the frames on either side of the given time.
+
+        :returns: ``(path_a, path_b)``, of the last frame starting at or before
+            the time, and the first starting at or after it. They are the same
+            if a frame starts at exactly that time.
+        :raises ValueError: if the time is outside of the cache.
+
+        """
+        frame_times = self.frame_times
+        starts = self._frame_starts
+        i = bisect.bisect_right(starts, time)
+        j = bisect.bisect_left(starts, time)
+        if not i or j == len(starts):
+            def format_time(time):
+                frames, ticks = divmod(time, self.time_per_frame)
+                return '%d:%d' % (frames, ticks)
+            if not starts:
+                raise ValueError('Cannot find data for time %s; there are no frames' % format_time(time))
+            raise ValueError('Cannot find data for time %s; have from %s to %s' % (
+                format_time(time),
+                format_time(starts[0]),
+                format_time(starts[-1]),
+            ))
+        return frame_times[i - 1][1], frame_times[j][1]
+
+    def get_frame_path(self, time):
+        """Get the path that the frame starting at the given time is named for."""
+        frame_no, tick = divmod(int(time), self.time_per_frame)
+        if tick:
+            name = '%sFrame%dTick%d.mc' % (self.base_name, frame_no, tick)
+        else:
+            name = '%sFrame%d.mc' % (self.base_name, frame_no)
+        return os.path.join(self.directory, name)
+
+    def offset_xml(self, offset):
+        """Shift the time range of the cache and its channels by some ticks."""
+        time = self.etree.find('time')
+        min_time, max_time = [int(x) for x in time.get('Range').split('-')]
+        time.set('Range', '%d-%d' % (min_time + offset, max_time + offset))
+        for channel in self.etree.find('Channels'):
+            for key in ('StartTime', 'EndTime'):
+                value = channel.get(key)
+                if value is not None:
+                    channel.set(key, str(int(value) + offset))
 
     def update_xml(self, min_time, max_time):
         self.etree.find('time').set('Range', '%d-%d' % (min_time, max_time))
@@ -151,20 +236,26 @@ class Frame(object):
 
     _header_tags = set(('STIM', 'ETIM'))
 
+    # Shapes need these to be finalized, whichever channels are read.
+    _geometry_interpretations = ('resolution', 'offset')
+
     def __init__(self, cache=None, path=None):
 
         self.cache = cache
         self.path = path
-        self.parser = None
+        self.index = None
 
         self._channels = {}
         self._headers = {}
         self._shapes = {}
 
+        self._channel_positions = None
+        self._read_all = False
+
     def close(self):
-        if self.parser:
-            self.parser.close()
-            self.parser = None
+        if self.index:
+            self.index.close()
+            self.index = None
 
     def free(self):
         self.close()
@@ -172,6 +263,8 @@ class Frame(object):
             channel.data = ()
         self._channels = {}
         self._shapes = {}
+        self._channel_positions = None
+        self._read_all = False
 
     def pprint(self):
         print 'Frame from %d to %d' % (self.start_time, self.end_time)
@@ -184,13 +277,18 @@ class Frame(object):
             print '\t\tbb_max: %r' % (shape.bb_max, )
 
     def parse_headers(self):
-        self.parser = self.parser or binary.Parser(open(self.path, 'rb'))
-        while True:
-            if all(tag in self._headers for tag in self._header_tags):
-                break
-            chunk = self.parser.parse_next()
-            if chunk.tag in self._header_tags:
-                self._headers[chunk.tag] = chunk.ints[0]
+        if self.index:
+            for tag in self._header_tags:
+                self._headers[tag] = self.index.find_one(tag).ints[0]
+            return
+        # Only the CACH group is read; the channels are seeked past.
+        parser = binary.Parser.from_path(self.path, include=('CACH', ))
+        try:
+            parser.parse_all()
+            for tag in self._header_tags:
+                self._headers[tag] = parser.find_one(tag).ints[0]
+        finally:
+            parser.close()
 
     @property
     def headers(self):
@@ -209,33 +307,84 @@ class Frame(object):
         self.headers['STIM'] = int(start)
         self.headers['ETIM'] = int(end)
 
+    def patch_headers(self):
+        """Write the headers into the frame's file in place, without rewriting it."""
+        chunk = binary.Chunk(None)
+        for tag in sorted(self._header_tags):
+            chunk.ints = [self.headers[tag]]
+            binary.patch_chunk(self.path, tag, chunk.data)
+        # The file has changed under the index.
+        self.close()
+
     @property
     def channels(self):
-        if not self._channels and self.path:
+        if self.path and not self._read_all:
             self.shapes
         return self._channels
 
     @property
     def shapes(self):
-        if not self._shapes and self.path:
+        if self.path and not self._read_all:
+            self.read_channels(self.channel_positions)
+            self._read_all = True
+        return self._shapes
 
+    @property
+    def channel_positions(self):
+        """The positions in the :attr:`index` of the data of each channel, by name.
+
+        Only the channel names are read from the file to build this.
+
+        """
+        if self._channel_positions is None and self.path:
+            self.index = self.index or binary.Index.for_path(self.path)
+            positions = collections.OrderedDict()
+            for name_i, data_i in binary.compile_selector('MYCH/CHNM+FBCA').select_positions(self.index):
+                if data_i is not None:
+                    positions[self.index.node(name_i).string] = data_i
+            self._channel_positions = positions
+        return self._channel_positions
+
+    def read_channels(self, names):
+        """Read only the given channels, leaving the rest of the frame unread.
+
+        The resolution and offset of every shape are always read, since the
+        shapes cannot be used without them. Channels which have already been
+        read are not read again.
+
+        :param names: Channel names (e.g. ``"fluidShape1_density"``), or
+            interpretations (e.g. ``"density"``) to read that channel of
+            every shape. Channels which are not in the frame are ignored.
+        :returns: The shapes of the frame, by name, with only the channels
+            read so far.
+
+        """
+
+        if not self.path:
+            return self._shapes
+        positions = self.channel_positions
+        specs = self.cache.channel_specs
+
+        if not self._shapes:
             for shape_name, shape_spec in self.cache.shape_specs.iteritems():
-                shape = Shape(self, shape_spec)
-                self._shapes[shape_name] = shape
-
-            self.parse_headers()
-            self.parser.parse_all()
-            channels = self.parser.find_one('MYCH')
-            for name, data in zip(channels.find('CHNM'), channels.find('FBCA')):
-                name = name.string
-                data = data.floats
-                self._channels[name] = Channel(self, name, data)
-
+                self._shapes[shape_name] = Shape(self, shape_spec)
+            self._read_channel_data(name for name in positions if specs[name].interpretation in self._geometry_interpretations)
             for shape in self._shapes.itervalues():
                 shape.finalize()
 
+        names = set(names)
+        self._read_channel_data(name for name in positions if name not in self._channels and (
+            name in names or specs[name].interpretation in names
+        ))
+
         return self._shapes
 
+    def _read_channel_data(self, names):
+        # In the order of the file, so that we only ever seek forwards.
+        positions = self.channel_positions
+        for name in sorted(names, key=positions.get):
+            Channel(self, name, self.index.node(positions[name]).floats)
+
     def dumps_iter(self):
         """Prepare all channels and specs for dumping, and then do it."""
 
@@ -254,6 +403,35 @@ class Frame(object):
 
         return root.dumps_iter()
 
+    def dump(self, fh):
+        """Write all channels to the given seekable file, one at a time.
+
+        Unlike :meth:`dumps_iter`, only one packed channel is in memory at once.
+        Frames which are too large for 32-bit sizes are written as 64-bit.
+
+        """
+
+        # Channels dominate the size; allow generously for everything else.
+        size = 1024 + sum(64 + len(c.name) + 4 * len(c.data) for c in self.channels.itervalues())
+        writer = binary.Writer(fh, is_64bit=size > 0xffffffff)
+        chunk = binary.Chunk(None)
+
+        with writer.group('CACH'):
+            writer.write_chunk('VRSN', '0.1\0')
+            chunk.ints = [self.headers['STIM']]
+            writer.write_chunk('STIM', chunk.data)
+            chunk.ints = [self.headers['ETIM']]
+            writer.write_chunk('ETIM', chunk.data)
+
+        with writer.group('MYCH'):
+            for interpretation, channel in self.channels.iteritems():
+                writer.write_chunk('CHNM', channel.name + '\0')
+                chunk.ints = [len(channel.data)]
+                writer.write_chunk('SIZE', chunk.data)
+                chunk.floats = channel.data
+                writer.write_chunk('FBCA', chunk.data)
+                chunk.data = ''
+
 class Shape(object):
 
     def __init__(self, frame, spec, channels=None):
@@ -263,11 +441,13 @@ class Shape(object):
         self.spec = spec
         self.channels = dict(channels or {})
 
+        self._center_grid = None
+
     def finalize(self):
 
         res_channel = self.channels.get('resolution')
         if res_channel:
-            self.resolution = res_channel.data
+            self.resolution = tuple(int(x) for x in res_channel.data)
         else:
             self.resolution = self.spec.resolution
 
@@ -342,6 +522,133 @@ class Shape(object):
             print 'Stats: %d/%d %d/%d %d/%d' % (xi, xr, yi, yr, zi, zr)
             raise
 
+    def center_grid(self):
+        """The centres of every voxel, in the order of their data.
+
+        Vectorised :meth:`iter_centers`; requires :mod:`numpy`.
+
+        :returns: ``(x, y, z)`` flat arrays, built once and then cached.
+
+        """
+        if self._center_grid is None:
+            axes = [
+                self.bb_min[i] + self.spec.unit_size[i] * (0.5 + numpy.arange(int(self.resolution[i])))
+                for i in xrange(3)
+            ]
+            z, y, x = numpy.meshgrid(axes[2], axes[1], axes[0], indexing='ij')
+            self._center_grid = (x.ravel(), y.ravel(), z.ravel())
+        return self._center_grid
+
+    def indices_for_points(self, x, y, z):
+        """Vectorised :meth:`index_for_point`.
+
+        :returns: ``(xi, yi, zi, inside)``; integer arrays of voxel coordinates,
+            and a boolean array of which points are within the bounds. Points
+            outside of the bounds are given the nearest voxel.
+
+        """
+        indices = []
+        for axis, coords in enumerate((x, y, z)):
+            # Truncation is flooring, since points inside are never negative.
+            index = ((coords - self.bb_min[axis]) / self.spec.unit_size[axis]).astype(numpy.intp)
+            indices.append(numpy.clip(index, 0, int(self.resolution[axis]) - 1, out=index))
+        return indices[0], indices[1], indices[2], self.contains_points(x, y, z)
+
+    def contains_points(self, x, y, z):
+        """A boolean array of which points are within the bounds."""
+        inside = numpy.ones(len(x), dtype=bool)
+        for axis, coords in enumerate((x, y, z)):
+            inside &= coords >= self.bb_min[axis]
+            inside &= coords <= self.bb_max[axis]
+        return inside
+
+    def lookup_values(self, channel, x, y, z):
+        """Vectorised :meth:`lookup_value`.
+
+        :returns: An array of one row of ``channel.data_size`` values for each
+            point, which are zero for points outside of the bounds.
+
+        """
+        xi, yi, zi, inside = self.indices_for_points(x, y, z)
+        xr = int(self.resolution[0])
+        yr = int(self.resolution[1])
+        data = _as_numpy(channel.data).reshape(-1, channel.data_size)
+        values = data[xi + (yi * xr) + (zi * xr * yr)].astype(float)
+        values[~inside] = 0.0
+        return values
+
+    def lookup_velocities(self, channel, x, y, z):
+        """Vectorised :meth:`lookup_velocity`.
+
+        :returns: An array of one ``(u, v, w)`` row for each point, which are
+            zero for points outside of the bounds.
+
+        """
+        xi, yi, zi, inside = self.indices_for_points(x, y, z)
+        xr = int(self.resolution[0])
+        yr = int(self.resolution[1])
+        zr = int(self.resolution[2])
+        data_indices = (
+            xi + (yi * (xr + 1)) + (zi * (xr + 1) *  yr     ),
+            xi + (yi *  xr     ) + (zi *  xr      * (yr + 1)) + ((xr + 1) * yr * zr),
+            xi + (yi *  xr     ) + (zi *  xr      *  yr     ) + ((xr + 1) * yr * zr) + (xr * (yr + 1) * zr),
+        )
+        data = self._velocity_data(channel)
+        values = numpy.empty((len(xi), 3))
+        for i, indices in enumerate(data_indices):
+            values[:, i] = data[indices]
+        values[~inside] = 0.0
+        return values
+
+    def _velocity_data(self, channel):
+        xr, yr, zr = [int(x) for x in self.resolution]
+        data = _as_numpy(channel.data)
+        expected = 3 * xr * yr * zr + xr * yr + yr * zr + zr * xr
+        if len(data) < expected:
+            raise IndexError('not enough fluid data; have %d of %d expected floats' % (len(data), expected))
+        return data
+
+    def sample_values(self, channel, x, y, z):
+        """Trilinearly interpolate a cell-centred channel at many points.
+
+        Like :meth:`lookup_values`, but blending the 8 voxels around each
+        point. Points within half a voxel of the bounds take the value of
+        the edge.
+
+        """
+        res = [int(r) for r in self.resolution]
+        data = _as_numpy(channel.data).reshape(-1, channel.data_size)
+        coords = [(c - self.bb_min[i]) / self.spec.unit_size[i] - 0.5 for i, c in enumerate((x, y, z))]
+        values = _sample_linear(data, res, coords)
+        values[~self.contains_points(x, y, z)] = 0.0
+        return values
+
+    def sample_velocities(self, channel, x, y, z):
+        """Trilinearly interpolate a face-centred velocity channel at many points.
+
+        Like :meth:`lookup_velocities`, but each component is interpolated
+        within its own grid. Component ``i`` is sampled on the faces normal
+        to axis ``i``, which are at the voxel boundaries along that axis and
+        at the voxel centres along the others.
+
+        """
+        res = [int(r) for r in self.resolution]
+        data = self._velocity_data(channel)
+        values = numpy.empty((len(x), 3))
+        start = 0
+        for component in xrange(3):
+            dims = list(res)
+            dims[component] += 1
+            size = dims[0] * dims[1] * dims[2]
+            coords = [
+                (c - self.bb_min[i]) / self.spec.unit_size[i] - (0.0 if i == component else 0.5)
+                for i, c in enumerate((x, y, z))
+            ]
+            values[:, component] = _sample_linear(data[start:start + size].reshape(-1, 1), dims, coords)[:, 0]
+            start += size
+        values[~self.contains_points(x, y, z)] = 0.0
+        return values
+
     @classmethod
     def setup_blend(cls, frame, name, shape_a, shape_b):
 
@@ -369,34 +676,88 @@ class Shape(object):
 
         return self
 
-    def blend(self, blend_factor, advect=1.0):
+    def blend(self, blend_factor, advect=1.0, interpolation='nearest'):
+        """Blend the channels of the two source shapes.
+
+        :param float blend_factor: How far from the first shape to the second.
+        :param float advect: How far to move the sources along their
+            velocities, in frames per frame between them.
+        :param str interpolation: ``"nearest"`` to take the value of the voxel
+            containing each point, or ``"linear"`` to interpolate between
+            the voxels around it (which requires :mod:`numpy`).
+
+        """
         has_vel = 'velocity' in self.src_a.channels
         for interpretation in self.src_a.channels:
             if interpretation in ('density', ):
-                self.blend_channel(interpretation, blend_factor, advect=advect if has_vel else 0)
+                self.blend_channel(interpretation, blend_factor, advect=advect if has_vel else 0, interpolation=interpolation)
 
-    def blend_channel(self, interpretation, blend_factor, advect=0):
+    def blend_channel(self, interpretation, blend_factor, advect=0, interpolation='nearest'):
 
-        blend_factor_inv = 1.0 - blend_factor
+        if interpolation not in ('nearest', 'linear'):
+            raise ValueError('unknown interpolation %r' % interpolation)
+        if interpolation == 'linear' and numpy is None:
+            raise RuntimeError('numpy is not installed')
 
         a_channel = self.src_a.channels[interpretation]
         b_channel = self.src_b.channels[interpretation]
 
-        lookup_a = self.src_a.lookup_value
-        lookup_b = self.src_b.lookup_value
-
+        advect_scale = 0
         if advect:
             if not isinstance(advect, float):
                 advect = 1.0
             advect_scale = advect * (self.src_b.frame.start_time - self.src_a.frame.end_time) / self.cache.time_per_frame
-            lookup_vel_a = lambda x, y, z, channel=self.src_a.channels['velocity'], lookup=self.src_a.lookup_velocity: lookup(channel, x, y, z)
-            lookup_vel_b = lambda x, y, z, channel=self.src_b.channels['velocity'], lookup=self.src_b.lookup_velocity: lookup(channel, x, y, z)
 
-        data = []
+        print '\t\tblending', interpretation
+        if numpy is None:
+            data = self._blend_channel_python(a_channel, b_channel, blend_factor, advect, advect_scale)
+        else:
+            data = self._blend_channel_numpy(a_channel, b_channel, blend_factor, advect, advect_scale, interpolation)
+
         dst_channel = Channel(self.frame, self.spec.name + '_' + interpretation, data)
         self.channels[interpretation] = dst_channel
 
-        print '\t\tblending', interpretation
+    def _blend_channel_numpy(self, a_channel, b_channel, blend_factor, advect, advect_scale, interpolation='nearest'):
+
+        blend_factor_inv = 1.0 - blend_factor
+
+        if interpolation == 'linear':
+            lookup_a, lookup_vel_a = self.src_a.sample_values, self.src_a.sample_velocities
+            lookup_b, lookup_vel_b = self.src_b.sample_values, self.src_b.sample_velocities
+        else:
+            lookup_a, lookup_vel_a = self.src_a.lookup_values, self.src_a.lookup_velocities
+            lookup_b, lookup_vel_b = self.src_b.lookup_values, self.src_b.lookup_velocities
+
+        x, y, z = self.center_grid()
+        x_a = x_b = x
+        y_a = y_b = y
+        z_a = z_b = z
+        if advect:
+            vel_a = lookup_vel_a(self.src_a.channels['velocity'], x, y, z)
+            vel_b = lookup_vel_b(self.src_b.channels['velocity'], x, y, z)
+            x_a = x - blend_factor * vel_a[:, 0] * advect_scale
+            y_a = y - blend_factor * vel_a[:, 1] * advect_scale
+            z_a = z - blend_factor * vel_a[:, 2] * advect_scale
+            x_b = x + blend_factor_inv * vel_b[:, 0] * advect_scale
+            y_b = y + blend_factor_inv * vel_b[:, 1] * advect_scale
+            z_b = z + blend_factor_inv * vel_b[:, 2] * advect_scale
+
+        a = lookup_a(a_channel, x_a, y_a, z_a)
+        b = lookup_b(b_channel, x_b, y_b, z_b)
+        return (a * blend_factor_inv + b * blend_factor).ravel()
+
+    def _blend_channel_python(self, a_channel, b_channel, blend_factor, advect, advect_scale):
+
+        blend_factor_inv = 1.0 - blend_factor
+
+        lookup_a = self.src_a.lookup_value
+        lookup_b = self.src_b.lookup_value
+
+        if advect:
+            lookup_vel_a = lambda x, y, z, channel=self.src_a.channels['velocity'], lookup=self.src_a.lookup_velocity: lookup(channel, x, y, z)
+            lookup_vel_b = lambda x, y, z, channel=self.src_b.channels['velocity'], lookup=self.src_b.lookup_velocity: lookup(channel, x, y, z)
+
+        data = array.array('f')
         for centre in self.iter_centers():
             centre_a = centre_b = centre
             if advect:
@@ -405,6 +766,60 @@ class Shape(object):
             a = lookup_a(a_channel, *centre_a)
             b = lookup_b(b_channel, *centre_b)
             data.extend(av * blend_factor_inv + bv * blend_factor for av, bv in zip(a, b))
+        return data
+
+
+def _sample_linear(data, dims, coords):
+    """Trilinearly interpolate a grid at continuous voxel coordinates.
+
+    :param data: An array of one row for each voxel, with x varying fastest.
+    :param dims: The number of voxels along each axis.
+    :param coords: Arrays of the coordinates along each axis, in voxels from
+        the first centre. They are clamped to the grid.
+    :returns: An array of one interpolated row for each point.
+
+    """
+
+    lows = []
+    fracs = []
+    for dim, coord in zip(dims, coords):
+        coord = numpy.clip(coord, 0, dim - 1)
+        # The last cell is interpolated from the second last to the edge.
+        low = numpy.minimum(coord.astype(numpy.intp), max(dim - 2, 0))
+        lows.append(low)
+        fracs.append((coord - low)[:, None])
+
+    values = numpy.zeros((len(lows[0]), data.shape[1]))
+    for dz in (0, 1):
+        zi = numpy.minimum(lows[2] + dz, dims[2] - 1)
+        wz = fracs[2] if dz else 1.0 - fracs[2]
+        for dy in (0, 1):
+            yi = numpy.minimum(lows[1] + dy, dims[1] - 1)
+            wy = fracs[1] if dy else 1.0 - fracs[1]
+            for dx in (0, 1):
+                xi = numpy.minimum(lows[0] + dx, dims[0] - 1)
+                wx = fracs[0] if dx else 1.0 - fracs[0]
+                values += (wx * wy * wz) * data[xi + (yi * dims[0]) + (zi * dims[0] * dims[1])]
+    return values
+
+
+def _as_float_array(values):
+    """Get values as a contiguous ``array.array('f')``, without copying arrays."""
+    if isinstance(values, array.array) and values.typecode == 'f':
+        return values
+    if numpy is not None and isinstance(values, numpy.ndarray):
+        # Let numpy convert them in bulk, directly into the array.
+        data = array.array('f', [0.0]) * values.size
+        numpy.frombuffer(data, numpy.float32)[:] = values.ravel()
+        return data
+    return array.array('f', values)
+
+
+def _as_numpy(data):
+    # Decoded channels are arrays, which numpy can view without copying.
+    if isinstance(data, array.array):
+        return numpy.frombuffer(data, data.typecode)
+    return numpy.asarray(data)
 
 
 class Channel(object):
@@ -419,7 +834,7 @@ class Channel(object):
 
         self.shape = self.frame._shapes[self.spec.shape]
         self.shape.channels[self.spec.interpretation] = self
-        self.frame.channels[name] = self
+        self.frame._channels[name] = self
         
         self.interpretation = self.spec.interpretation
         self.data_size = {
@@ -429,6 +844,20 @@ class Channel(object):
 
         self.data = data
 
+    @property
+    def data(self):
+        """The values of the channel, as a contiguous ``array.array('f')``.
+
+        This is settable to any sequence of floats (including a
+        :class:`numpy.ndarray`), which is converted to an array.
+
+        """
+        return self._data
+
+    @data.setter
+    def data(self, values):
+        self._data = _as_float_array(values)
+
 
 if __name__ == '__main__':
 
@@ -455,7 +884,7 @@ if __name__ == '__main__':
                 if frame.start_time < start_time or frame.end_time > end_time:
                     continue
 
-                for shape in frame.shapes.itervalues():
+                for shape in frame.read_channels(('density', 'velocity')).itervalues():
                     den = shape.channels.get('density')
                     vel = shape.channels.get('velocity')
                     if not den or not vel:
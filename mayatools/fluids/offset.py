@@ -0,0 +1,132 @@
+import functools
+import os
+import sys
+
+from optparse import OptionParser
+
+from .. import binary
+from .core import Cache
+
+
+def main():
+
+    option_parser = OptionParser(usage='%prog [options] cache.xml')
+    option_parser.add_option('-f', '--frames', type='float', help='offset by this many frames')
+    option_parser.add_option('-t', '--ticks', type='int', help='offset by this many ticks')
+    option_parser.add_option('-n', '--dry-run', action='store_true')
+    option_parser.add_option('-v', '--verbose', action='count', default=0)
+    opts, args = option_parser.parse_args()
+
+    if len(args) != 1 or (opts.frames is None) == (opts.ticks is None):
+        option_parser.print_usage()
+        exit(1)
+
+    cache = Cache(args[0])
+    if opts.ticks is None:
+        offset = int(round(opts.frames * cache.time_per_frame))
+    else:
+        offset = opts.ticks
+
+    offset_cache(cache, offset, dry_run=opts.dry_run, verbose=opts.verbose)
+
+
+def offset_cache(cache, offset, dry_run=False, verbose=0):
+    """Shift all frames of a cache in time, in place.
+
+    The times in the frames are patched without rewriting them, the frames
+    are renamed for their new times, and the XML is updated to match.
+
+    Everything is planned before anything is touched, and if any step fails
+    then all of the steps before it are undone before the error is raised.
+    This cannot protect against the process being killed part way through.
+
+    :param cache: A :class:`~mayatools.fluids.core.Cache`, or the path to its XML.
+    :param int offset: How many ticks to shift by.
+    :param bool dry_run: Only print what would be done.
+
+    """
+
+    if isinstance(cache, basestring):
+        cache = Cache(cache)
+
+    # Plan everything before touching anything.
+    moves = []
+    for frame in cache.frames:
+        start_time = frame.start_time + offset
+        end_time = frame.end_time + offset
+        if start_time < 0:
+            raise ValueError('%s would start at negative time %d' % (frame.path, start_time))
+        moves.append((frame, start_time, end_time, cache.get_frame_path(start_time)))
+    moves.sort(key=lambda move: move[1])
+
+    new_paths = [move[3] for move in moves]
+    if len(set(new_paths)) != len(new_paths):
+        raise ValueError('multiple frames would start at the same time')
+
+    for frame, start_time, end_time, new_path in moves:
+        if verbose or dry_run:
+            print '%s -> %s (%d to %d)' % (os.path.basename(frame.path), os.path.basename(new_path), start_time, end_time)
+
+    if dry_run:
+        return
+
+    # How to undo everything done so far, in the order it was done.
+    undo = []
+
+    try:
+
+        for frame, start_time, end_time, new_path in moves:
+            undo.append(functools.partial(_set_times, frame, frame.start_time, frame.end_time))
+            _set_times(frame, start_time, end_time)
+
+        # Go via temporary names, since the new names may currently be in use.
+        for frame, start_time, end_time, new_path in moves:
+            try:
+                os.unlink(binary.get_index_path(frame.path))
+            except OSError:
+                pass
+            old_path = frame.path
+            _move(frame, new_path + '.offset.tmp')
+            undo.append(functools.partial(_move, frame, old_path))
+        for frame, start_time, end_time, new_path in moves:
+            old_path = frame.path
+            _move(frame, new_path)
+            undo.append(functools.partial(_move, frame, old_path))
+
+        # Replace the XML in one step, so that it is either old or new.
+        cache.offset_xml(offset)
+        undo.append(functools.partial(cache.offset_xml, -offset))
+        tmp_path = cache.xml_path + '.offset.tmp'
+        undo.append(functools.partial(_remove, tmp_path))
+        cache.write_xml(tmp_path)
+        os.rename(tmp_path, cache.xml_path)
+        cache._frame_times = None
+
+    except:
+        exc_info = sys.exc_info()
+        for func in reversed(undo):
+            try:
+                func()
+            except Exception as e:
+                print >> sys.stderr, 'could not undo offset: %s' % e
+        cache._frame_times = None
+        raise exc_info[0], exc_info[1], exc_info[2]
+
+
+def _set_times(frame, start_time, end_time):
+    frame.set_times(start_time, end_time)
+    frame.patch_headers()
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.unlink(path)
+
+
+def _move(frame, path):
+    os.rename(frame.path, path)
+    frame.path = path
+
+
+if __name__ == '__main__':
+    main()
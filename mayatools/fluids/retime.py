@@ -1,9 +1,20 @@
+import collections
 import math
+import multiprocessing
 import os
+import Queue
+import signal
+import sys
+import threading
+import time
+import traceback
 
 from optparse import OptionParser
 
-import qbfutures
+try:
+    import qbfutures
+except ImportError:
+    qbfutures = None
 
 from .core import Cache, Frame, Shape, Channel
 
@@ -23,6 +34,162 @@ def iter_ticks(src_start, src_end, dst_start, dst_end, sampling_rate):
         yield src_time, dst_time
 
 
+#: A unit of work; blending all of the ``(src_time, dst_time)`` ticks which
+#: are between the same two source frames, so that they are only read once.
+RetimeTask = collections.namedtuple('RetimeTask', ('frame_a', 'frame_b', 'ticks'))
+
+
+def plan_retime(src_cache, src_start, src_end, dst_start, dst_end, sampling_rate, chunk_size=None):
+    """Group the ticks of a retime into tasks by the source frames they need.
+
+    Consecutive ticks which are between the same pair of frames go into the
+    same task, up to ``chunk_size`` ticks each.
+
+    :param src_cache: The :class:`~mayatools.fluids.core.Cache` to read.
+    :param int chunk_size: The most ticks in one task, or ``None`` for no limit.
+    :returns: A list of :class:`RetimeTask`, in order.
+
+    """
+    tasks = []
+    for src_time, dst_time in iter_ticks(src_start, src_end, dst_start, dst_end, sampling_rate):
+        frame_a, frame_b = src_cache.get_frames_for(src_time)
+        task = tasks[-1] if tasks else None
+        if (
+            task is None or
+            (task.frame_a, task.frame_b) != (frame_a, frame_b) or
+            (chunk_size and len(task.ticks) >= chunk_size)
+        ):
+            task = RetimeTask(frame_a, frame_b, [])
+            tasks.append(task)
+        task.ticks.append((src_time, dst_time))
+    return tasks
+
+
+def _run_local_call(queue, i, func, args):
+    # Interrupts are for the parent, which will terminate us if it wants to.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        func(*args)
+    except Exception:
+        queue.put((i, traceback.format_exc()))
+    else:
+        queue.put((i, None))
+
+
+class LocalExecutor(object):
+
+    """Runs calls in a pool of local processes, as the farm would.
+
+    Every call runs in a fresh process, so a call which crashes its process
+    (e.g. by running out of memory) only fails itself, and is retried. Calls
+    which raise an exception are not retried.
+
+    The run is stopped by :meth:`cancel` (e.g. from another thread) or an
+    interrupt, which terminates the running calls.
+
+    :param int jobs: How many calls to run at once; defaults to the number of
+        cores.
+    :raises ValueError: if ``jobs`` is negative.
+    :param int retries: How many times to retry calls which crash.
+    :param bool progress: Print a line as each call finishes.
+
+    """
+
+    poll_interval = 0.5
+
+    def __init__(self, jobs=None, retries=1, progress=True):
+        if jobs is not None and jobs < 0:
+            raise ValueError('jobs must not be negative; got %r' % jobs)
+        self.jobs = jobs or multiprocessing.cpu_count()
+        self.retries = retries
+        self.progress = progress
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self, func, calls):
+        """Call ``func(*args)`` for all of the given calls.
+
+        :param calls: A list of ``(name, args)``.
+        :returns: A list of ``(name, error)`` for the calls which failed or
+            were cancelled.
+
+        """
+
+        queue = multiprocessing.Queue()
+        pending = collections.deque((i, 0) for i in xrange(len(calls)))
+        running = {}
+        failed = []
+        finished = 0
+        start_time = time.time()
+
+        try:
+            while (pending or running) and not self.cancelled:
+
+                while pending and len(running) < self.jobs:
+                    i, attempt = pending.popleft()
+                    process = multiprocessing.Process(target=_run_local_call, args=(queue, i, func, calls[i][1]))
+                    process.daemon = True
+                    process.start()
+                    running[i] = (process, attempt)
+
+                results = []
+                try:
+                    results.append(queue.get(timeout=self.poll_interval))
+                except Queue.Empty:
+                    pass
+
+                # Results are flushed before a process exits, so anything which
+                # is dead now and has not reported by the end of this crashed.
+                dead = [i for i, (process, attempt) in running.iteritems() if not process.is_alive()]
+                while True:
+                    try:
+                        results.append(queue.get_nowait())
+                    except Queue.Empty:
+                        break
+                reported = set(i for i, error in results)
+                for i in dead:
+                    if i not in reported:
+                        process, attempt = running[i]
+                        results.append((i, 'process exited with code %s' % process.exitcode))
+
+                for i, error in results:
+                    process, attempt = running.pop(i)
+                    process.join()
+                    name = calls[i][0]
+                    if error is not None and i not in reported and attempt < self.retries:
+                        if self.progress:
+                            print >> sys.stderr, '%s crashed (%s); retrying' % (name, error)
+                        pending.append((i, attempt + 1))
+                        continue
+                    finished += 1
+                    if error is not None:
+                        failed.append((name, error))
+                    if self.progress:
+                        print >> sys.stderr, '[%d/%d %ds] %s%s' % (
+                            finished, len(calls), time.time() - start_time, name,
+                            ': FAILED\n' + error.rstrip() if error is not None else '',
+                        )
+
+        except KeyboardInterrupt:
+            self.cancel()
+
+        finally:
+            for process, attempt in running.itervalues():
+                process.terminate()
+            for process, attempt in running.itervalues():
+                process.join()
+
+        if self.cancelled:
+            unfinished = sorted(running.keys() + [i for i, attempt in pending])
+            failed.extend((calls[i][0], 'cancelled') for i in unfinished)
+            if self.progress:
+                print >> sys.stderr, 'Cancelled; %d of %d were not finished.' % (len(unfinished), len(calls))
+
+        return failed
+
+
 def main():
 
     option_parser = OptionParser(usage='%prog [options] input.xml, output.xml')
@@ -34,12 +201,21 @@ def main():
     option_parser.add_option('-v', '--verbose', action='count', default=0)
     option_parser.add_option('-f', '--farm', action='store_true')
     option_parser.add_option('-w', '--workers', type='int', default=20)
+    option_parser.add_option('-j', '--jobs', type='int', default=1,
+        help='blend this many tasks at once locally; 0 for one per core')
+    option_parser.add_option('-c', '--chunk-size', type='int', default=8,
+        help='the most ticks to blend in one task; 0 for no limit')
     option_parser.add_option('-a', '--advect', type='float', default=0.0)
+    option_parser.add_option('-i', '--interpolation', type='choice', choices=('nearest', 'linear'), default='nearest')
+    option_parser.add_option('--verify', action='store_true',
+        help='check the headers of the source frames against their names')
     opts, args = option_parser.parse_args()
 
     if len(args) != 2:
         option_parser.print_usage()
         exit(1)
+    if opts.jobs < 0:
+        option_parser.error('--jobs must not be negative')
 
 
     res = schedule_retime(*args,
@@ -51,11 +227,18 @@ def main():
         verbose=opts.verbose,
         farm=opts.farm,
         workers=opts.workers,
-        advect=opts.advect
+        jobs=opts.jobs,
+        chunk_size=opts.chunk_size or None,
+        advect=opts.advect,
+        interpolation=opts.interpolation,
+        verify=opts.verify
     )
 
     if opts.farm:
         print 'Qube job ID', res
+    elif res:
+        print >> sys.stderr, '%d tasks failed.' % len(res)
+        exit(1)
 
 
 def schedule_retime(
@@ -65,8 +248,12 @@ def schedule_retime(
     sampling_rate=1.0,
     farm=True,
     workers=20,
+    jobs=1,
+    chunk_size=8,
     verbose=0,
     advect=0.0,
+    interpolation='nearest',
+    verify=False,
 ):
 
     dst_path = os.path.abspath(dst_path)
@@ -85,30 +272,23 @@ def schedule_retime(
         src_cache.pprint()
 
 
-    # Load the headers for all the frames, and sort them by time.
-    frame_times = []
-    for frame in src_cache.frames:
-        frame_times.append((frame.start_time, frame.path))
-        frame.free()
-    frame_times.sort()
+    # The frames are sorted by the times in their names, without opening them.
+    frame_times = src_cache.frame_times
     if not frame_times:
         print 'No frames in src_cache.'
         exit(2)
 
-    # Reclaim the file handles.
-    src_cache.free()
-
     # Construct the new src_cache that our frames will go into.
     dst_cache = src_cache.clone()
     dst_base_path = os.path.join(dst_directory, dst_base_name)
 
     # Convert all time options into an integer of ticks.
     if dst_start is None:
-        dst_start = dst_cache.frames[0].start_time
+        dst_start = frame_times[0][0]
     else:
         dst_start = int(dst_start * dst_cache.time_per_frame)
     if dst_end is None:
-        dst_end = dst_cache.frames[-1].end_time
+        dst_end = Frame(src_cache, frame_times[-1][1]).end_time
     else:
         dst_end = int(dst_end * dst_cache.time_per_frame)
 
@@ -124,55 +304,190 @@ def schedule_retime(
     # This one remains a float.
     sampling_rate = sampling_rate * src_cache.time_per_frame
 
-    # Isolate the frames requested via src-*.
-    frames = [f for f in frame_times if f[0] >= dst_start and f[0] <= dst_end]
+    tasks = plan_retime(src_cache, src_start, src_end, dst_start, dst_end, sampling_rate, chunk_size)
+    if verbose:
+        print '%d ticks in %d tasks' % (sum(len(task.ticks) for task in tasks), len(tasks))
+
+    if verify:
+        # Only the frames which we will actually read.
+        paths = set()
+        for task in tasks:
+            paths.update((task.frame_a, task.frame_b))
+        src_cache.verify_frame_times([f for f in frame_times if f[1] in paths])
 
     # Write the new XML.
     dst_cache.update_xml(dst_start, dst_end)
     dst_cache.write_xml(dst_path)
 
-    def get_frames_for(src_time):
-        try:
-            frame_a_path = [f[1] for f in frame_times if f[0] <= src_time][-1]
-            frame_b_path = next(f[1] for f in frame_times if f[0] >= src_time)
-        except (IndexError, StopIteration):
-            def format_time(time):
-                frames, ticks = divmod(time, 250)
-                return '%d:%d' % (frames, ticks)
-            raise ValueError('Cannot find data for time %s; have from %s to %s' % (
-                format_time(src_time),
-                format_time(frames[0][0]),
-                format_time(frames[-1][0]),
-            ))
-        return frame_a_path, frame_b_path
+    calls = [(
+        'Blend %d to %d from %d' % (task.ticks[0][1], task.ticks[-1][1], task.ticks[0][0]),
+        [src_cache.xml_path, task.frame_a, task.frame_b, task.ticks, dst_base_path, advect, interpolation],
+    ) for task in tasks]
 
     if farm:
+        if qbfutures is None:
+            raise RuntimeError('qbfutures is not installed')
         executor = qbfutures.Executor(cpus=workers, groups='farm', reservations='host.processors=1')
         with executor.batch(name='Retime Fluid:%s:%s' % (os.path.basename(src_cache.directory), src_cache.shape_specs.keys()[0])) as batch:
-
-            for src_time, dst_time in iter_ticks(src_start, src_end, dst_start, dst_end, sampling_rate):
-                frame_a_path, frame_b_path = get_frames_for(src_time)
+            for name, args in calls:
                 batch.submit_ext(
-                    func='mayatools.fluids.retime:blend_one_on_farm',
-                    args=[src_cache.xml_path, src_time, dst_time, frame_a_path, frame_b_path, dst_base_path, advect],
-                    name='Blend %d from %d' % (dst_time, src_time),
+                    func='mayatools.fluids.retime:blend_task_on_farm',
+                    args=args,
+                    name=name,
                 )
         return batch.futures[0].job_id
 
-    # Iterate over the requested ticks.
-    for src_time, dst_time in iter_ticks(src_start, src_end, dst_start, dst_end, sampling_rate):
-        frame_a_path, frame_b_path = get_frames_for(src_time)
-        blend_one_on_farm(src_cache.xml_path, src_time, dst_time, frame_a_path, frame_b_path, dst_base_path, advect)
+    if jobs != 1:
+        return LocalExecutor(jobs).run(blend_task_on_farm, calls)
+
+    # One pipeline for everything, so frames are read ahead across tasks.
+    blend_tasks(src_cache.xml_path, tasks, dst_base_path, advect, interpolation)
+    return []
+
+
+def blend_task_on_farm(cache, frame_a, frame_b, ticks, dst_base_path, advect, interpolation='nearest'):
+    """Blend several ticks between the same two source frames.
+
+    The cache and source frames are loaded once, and shared by all of the
+    ticks; see :func:`plan_retime` and :func:`blend_tasks`.
+
+    """
+    blend_tasks(cache, [RetimeTask(frame_a, frame_b, ticks)], dst_base_path, advect, interpolation)
+
+
+def _put(queue, item, stop):
+    # Give up if the pipeline stops, instead of blocking on a full queue.
+    while True:
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Queue.Full:
+            if stop.is_set():
+                return False
+
+
+def _get(queue, stop):
+    # None at the end of the queue, or once the pipeline stops (even if there
+    # is more in the queue).
+    while not stop.is_set():
+        try:
+            return queue.get(timeout=0.1)
+        except Queue.Empty:
+            pass
+
+
+def _read_frame(cache, path, names=None):
+    """Read the headers and channels of a source frame, and close it."""
+    frame = Frame(cache, path)
+    if names is None:
+        frame.shapes
+    else:
+        frame.read_channels(names)
+    frame.headers
+    frame.close()
+    return frame
+
+
+def blend_tasks(cache, tasks, dst_base_path, advect, interpolation='nearest', depth=2):
+    """Blend the ticks of several tasks in a pipeline.
+
+    Source frames are read by a thread ahead of the blending, and blended
+    frames are written by another thread behind it, so that the disk is busy
+    while blending. At most ``depth`` pairs of source frames are read ahead,
+    and at most ``depth`` blended frames wait to be written, which bounds the
+    memory used.
 
+    Frames shared by consecutive tasks are only read once.
 
-def blend_one_on_farm(cache, src_time, dst_time, frame_a, frame_b, dst_base_path, advect):
+    :param cache: The source :class:`~mayatools.fluids.core.Cache`, or the
+        path to its XML.
+    :param tasks: The :class:`RetimeTask` to blend, with frame paths.
+    :raises: The first error of any stage, once they have all stopped.
+
+    """
 
     if isinstance(cache, basestring):
         cache = Cache(cache)
-    if isinstance(frame_a, basestring):
-        frame_a = Frame(cache, frame_a)
-    if isinstance(frame_b, basestring):
-        frame_b = Frame(cache, frame_b)
+
+    # Only what we blend is read; velocities are only needed to advect.
+    names = ('density', 'velocity') if advect else ('density', )
+
+    read_queue = Queue.Queue(depth)
+    write_queue = Queue.Queue(depth)
+    stop = threading.Event()
+    errors = []
+
+    def read():
+        try:
+            # Keyed by path and whether all channels are read. Frames are never
+            # read into further, since they may be being blended.
+            previous = {}
+            for task in tasks:
+                if stop.is_set():
+                    return
+                read_all = task.frame_a == task.frame_b
+                current = {}
+                for path in (task.frame_a, task.frame_b):
+                    frame = previous.get((path, True)) or previous.get((path, read_all)) or current.get((path, read_all))
+                    if frame is None:
+                        frame = _read_frame(cache, path, None if read_all else names)
+                    current[(path, read_all)] = frame
+                frame_a = current[(task.frame_a, read_all)]
+                frame_b = current[(task.frame_b, read_all)]
+                if not _put(read_queue, (task, frame_a, frame_b), stop):
+                    return
+                previous = current
+        except Exception:
+            errors.append(sys.exc_info())
+            stop.set()
+        _put(read_queue, None, stop)
+
+    def write():
+        try:
+            while True:
+                item = _get(write_queue, stop)
+                if item is None:
+                    return
+                write_frame(*item)
+        except Exception:
+            errors.append(sys.exc_info())
+            stop.set()
+
+    threads = [threading.Thread(target=read), threading.Thread(target=write)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        while not stop.is_set():
+            item = _get(read_queue, stop)
+            if item is None:
+                break
+            task, frame_a, frame_b = item
+            for src_time, dst_time in task.ticks:
+                # Another stage may have failed while we were blending.
+                if stop.is_set():
+                    break
+                dst_frame = blend_frame(cache, src_time, dst_time, frame_a, frame_b, advect, interpolation)
+                _put(write_queue, (dst_frame, get_dst_path(cache, dst_base_path, dst_time)), stop)
+    except BaseException:
+        errors.append(sys.exc_info())
+        stop.set()
+    finally:
+        _put(write_queue, None, stop)
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0][0], errors[0][1], errors[0][2]
+
+
+def blend_frame(cache, src_time, dst_time, frame_a, frame_b, advect, interpolation='nearest'):
+    """Blend a new frame at the given time from two source frames.
+
+    If both sources are the same frame, the new frame shares its channels.
+
+    """
 
     dst_frame = Frame(cache)
     dst_frame.set_times(dst_time, dst_time)
@@ -182,27 +497,62 @@ def blend_one_on_farm(cache, src_time, dst_time, frame_a, frame_b, dst_base_path
         dst_frame.channels.update(frame_a.channels)
 
     else:
+        # Only what we blend is read; velocities are only needed to advect.
+        names = ('density', 'velocity') if advect else ('density', )
+        shapes_a = frame_a.read_channels(names)
+        shapes_b = frame_b.read_channels(names)
         blend_factor = float(src_time - frame_a.start_time) / float(frame_b.start_time - frame_a.start_time)
-        for shape_name, shape_a in sorted(frame_a.shapes.iteritems()):
-            dst_shape = Shape.setup_blend(dst_frame, shape_name, frame_a, frame_b)
-            dst_shape.blend(blend_factor, advect)
+        for shape_name, shape_a in sorted(shapes_a.iteritems()):
+            dst_shape = Shape.setup_blend(dst_frame, shape_name, shape_a, shapes_b[shape_name])
+            dst_shape.blend(blend_factor, advect, interpolation)
+
+    return dst_frame
 
+
+def get_dst_path(cache, dst_base_path, dst_time):
     frame_no, tick = divmod(dst_time, cache.time_per_frame)
     if tick:
-        dst_path = '%sFrame%dTick%d.mc' % (dst_base_path, frame_no, tick)
+        return '%sFrame%dTick%d.mc' % (dst_base_path, frame_no, tick)
     else:
-        dst_path = '%sFrame%d.mc' % (dst_base_path, frame_no)
-    print 'Saving to', dst_path
+        return '%sFrame%d.mc' % (dst_base_path, frame_no)
+
+
+def write_frame(frame, path):
+    """Write a frame atomically, via a temporary file which is renamed into place.
+
+    Readers never see a partial frame, even if the writer is killed.
+
+    """
+
+    # In one write, since this may be on another thread than the blending.
+    sys.stdout.write('Saving to %s\n' % path)
 
     try:
-        os.makedirs(os.path.dirname(dst_path))
+        os.makedirs(os.path.dirname(path))
     except OSError:
         pass
 
-    with open(dst_path, 'wb') as fh:
-        for chunk in dst_frame.dumps_iter():
-            fh.write(chunk)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as fh:
+            frame.dump(fh)
+        os.rename(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def blend_one_on_farm(cache, src_time, dst_time, frame_a, frame_b, dst_base_path, advect, interpolation='nearest'):
+
+    if isinstance(cache, basestring):
+        cache = Cache(cache)
+    if isinstance(frame_a, basestring):
+        frame_a = Frame(cache, frame_a)
+    if isinstance(frame_b, basestring):
+        frame_b = Frame(cache, frame_b)
 
+    dst_frame = blend_frame(cache, src_time, dst_time, frame_a, frame_b, advect, interpolation)
+    write_frame(dst_frame, get_dst_path(cache, dst_base_path, dst_time))
 
 
 if __name__ == '__main__':
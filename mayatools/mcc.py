@@ -1,7 +1,8 @@
 import os
-import struct
 import glob
 
+from . import binary
+
 class ParseError(RuntimeError):
     pass
 
@@ -33,65 +34,20 @@ def get_channels(xml_path, memoize=True):
         # Return a copy of the list.
         return list(_get_channels_results[mcc_path][2])
     
-    fh = open(mcc_path, 'rb')
-    
-    # File header block.
-    tag = fh.read(4)
-    if tag != 'FOR4':
-        raise RuntimeError('bad FOR4 tag %r @ %x' % (tag, fh.tell()))
-    offset = struct.unpack('>i', fh.read(4))[0]
-    fh.seek(offset, 1)
-    
-    # Channel data block.
-    tag = fh.read(4)
-    if tag != 'FOR4':
-        raise RuntimeError('bad FOR4 tag %r @ %x' % (tag, fh.tell()))
-    
-    # Start of channel data.
-    offset = struct.unpack('>i', fh.read(4))[0]
-    tag = fh.read(4)
-    if tag != 'MYCH':
-        raise RuntimeError('bad MYCH tag %r @ %x' % (tag, fh.tell()))
-    
-    channels = []
-    while True:
-        
-        # Channel name.
-        tag = fh.read(4)
-        if not tag:
-            # We have reached the end of the file, and so we are done.
-            break
-        if tag != 'CHNM':
-            raise RuntimeError('bad CHNM tag %r @ %x' % (tag, fh.tell()))
-        name_size = struct.unpack('>i', fh.read(4))[0]
-        name = fh.read(name_size)[:-1]
-
-        # The stored name is padded to the next 4-byte boundary.
-        mask = 3
-        padded = (name_size + mask) & (~mask)
-        padding = padded - name_size
-        if padding:
-            fh.seek(padding, 1)
-        
-        # Channel size (e.g. point count).
-        tag = fh.read(4)
-        if tag != 'SIZE':
-            raise RuntimeError('bad SIZE tag %r @ %x' % (tag, fh.tell()))
-        point_count_size = struct.unpack('>i', fh.read(4))[0]
-        if point_count_size != 4:
-            raise RuntimeError('bad point_count_size %r @ %x' % (point_count_size, fh.tell()))
-        point_count = struct.unpack('>i', fh.read(point_count_size))[0]
-        
-        channels.append((name, point_count))
-        
-        # Skip the actual data.
-        tag = fh.read(4)
-        if tag == 'FVCA':
-            fh.seek(3 * 4 * point_count + 4, 1)
-        elif tag == 'DVCA':
-            fh.seek(3 * 8 * point_count + 4, 1)
-        else:
-            raise RuntimeError('bad FVCA/DVCA tag %r @ %x' % (tag, fh.tell()))
+    # The index is cached on disk, so repeated calls (even across processes)
+    # only read the channel names and sizes.
+    index = binary.Index.for_path(mcc_path)
+    try:
+        groups = index.positions('MYCH')
+        if not groups:
+            raise ParseError('no MYCH group in %r' % mcc_path)
+        channels = []
+        for name, size in index.select('CHNM+SIZE', within=groups[0]):
+            if size is None:
+                raise ParseError('no SIZE for %r in %r' % (name.string, mcc_path))
+            channels.append((name.string, size.ints[0]))
+    finally:
+        index.close()
     
     # Memoize the result.
     _get_channels_results[mcc_path] = (stat.st_size, stat.st_mtime, channels)
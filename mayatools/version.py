@@ -24,9 +24,18 @@ def detect_ascii_version(path):
 
 
 def detect_binary_version(path):
-    root = binary.parse(open(path))
-    vers = root.find_one('VERS')
-    return vers.string
+    # The version is in the header, so don't bother parsing the rest. Scenes
+    # wrap everything (including the header) in a top-level "Maya" group.
+    parser = binary.Parser.from_path(path, lazy=True, include=('Maya', 'HEAD'))
+    try:
+        while True:
+            node = parser.parse_next()
+            if node is None:
+                raise KeyError('VERS')
+            if node.tag == 'VERS':
+                return node.string
+    finally:
+        parser.close()
 
 
 if __name__ == '__main__':
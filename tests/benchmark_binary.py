@@ -0,0 +1,148 @@
+"""Benchmarks of mayatools.binary on synthetic files.
+
+Run as ``python tests/benchmark_binary.py``; see ``--help``.
+
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mayatools import binary
+
+
+def make_scene(path, chunk_count):
+    """Write a scene-like file of many small chunks, like the CREA/STR chunks
+    of a large ``.mb``; 5 chunks to a group."""
+    with open(path, 'wb') as fh:
+        writer = binary.Writer(fh)
+        with writer.group('HEAD'):
+            writer.write_chunk('VERS', '2014\0')
+        for i in xrange(chunk_count // 5):
+            with writer.group('XFRM'):
+                writer.write_chunk('CREA', '\x01node%d\0parent\0' % i)
+                for j in xrange(4):
+                    writer.write_chunk('STR ', 'attr%d\0value%d\0' % (j, i))
+
+
+class CountingFile(object):
+
+    """Counts the calls to a file, each of which may be a system call."""
+
+    def __init__(self, file):
+        self.file = file
+        self.calls = 0
+
+    def read(self, *args):
+        self.calls += 1
+        return self.file.read(*args)
+
+    def tell(self):
+        self.calls += 1
+        return self.file.tell()
+
+    def seek(self, *args):
+        self.calls += 1
+        return self.file.seek(*args)
+
+    def close(self):
+        self.file.close()
+
+
+def count_file_calls(path, **kwargs):
+    fh = CountingFile(open(path, 'rb'))
+    for event in binary.IterParser(fh, **kwargs):
+        pass
+    fh.close()
+    return fh.calls
+
+
+def timeit(func, repeat):
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_parse(path, **kwargs):
+    def func():
+        parser = binary.Parser.from_path(path, **kwargs)
+        parser.parse_all()
+        parser.close()
+    return func
+
+
+def bench_iterparse(path, **kwargs):
+    def func():
+        events = binary.iterparse(path, **kwargs)
+        for event in events:
+            pass
+        events.close()
+    return func
+
+
+def node_memory(path):
+    """Bytes of Python objects per node of a parsed file, not counting data."""
+    parser = binary.Parser.from_path(path)
+    parser.parse_all()
+    nodes = list(parser.walk())[1:]
+    total = 0
+    for node in nodes:
+        total += sys.getsizeof(node)
+        if hasattr(node, '__dict__'):
+            total += sys.getsizeof(node.__dict__)
+        if isinstance(node, binary.Group):
+            total += sys.getsizeof(node.children)
+    parser.close()
+    return float(total) / len(nodes)
+
+
+def main():
+
+    opt_parser = OptionParser()
+    opt_parser.add_option('-n', '--chunks', type='int', default=500000)
+    opt_parser.add_option('-r', '--repeat', type='int', default=3)
+    opts, args = opt_parser.parse_args()
+
+    sandbox = tempfile.mkdtemp()
+    try:
+
+        path = os.path.join(sandbox, 'scene.mb')
+        make_scene(path, opts.chunks)
+        print '%d chunks in %d bytes' % (opts.chunks, os.path.getsize(path))
+
+        for name, func in (
+            ('parse, unbuffered', bench_parse(path, block_size=0)),
+            ('parse, buffered', bench_parse(path)),
+            ('parse, mmap', bench_parse(path, mmap=True)),
+            ('iterparse, unbuffered', bench_iterparse(path, block_size=0)),
+            ('iterparse, buffered', bench_iterparse(path)),
+            ('iterparse, lazy', bench_iterparse(path, lazy=True)),
+            ('iterparse, mmap', bench_iterparse(path, mmap=True)),
+        ):
+            print '%-24s %.3fs' % (name, timeit(func, opts.repeat))
+
+        for name, kwargs in (
+            ('unbuffered', dict(block_size=0)),
+            ('buffered', {}),
+            ('lazy, unbuffered', dict(block_size=0, lazy=True)),
+            ('lazy, buffered', dict(lazy=True)),
+        ):
+            print '%-24s %d file calls' % (name, count_file_calls(path, **kwargs))
+
+        print '%-24s %.1f bytes per node' % ('node memory', node_memory(path))
+
+    finally:
+        shutil.rmtree(sandbox)
+
+
+if __name__ == '__main__':
+    main()
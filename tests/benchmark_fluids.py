@@ -0,0 +1,74 @@
+"""Benchmarks of mayatools.fluids on synthetic caches.
+
+Run as ``python tests/benchmark_fluids.py``; see ``--help``.
+
+"""
+
+import array
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mayatools.fluids.core import Cache, Frame, Shape
+
+from fluids_common import make_cache
+
+
+def setup_blend(xml_path):
+    cache = Cache(xml_path)
+    frame_a, frame_b = sorted(cache.frames, key=lambda frame: frame.start_time)[:2]
+    dst_frame = Frame(cache)
+    shape = Shape.setup_blend(dst_frame, 'fluidShape1', frame_a, frame_b)
+    return shape, shape.src_a.channels['density'], shape.src_b.channels['density']
+
+
+def timeit(func, repeat):
+    best = result = None
+    for i in xrange(repeat):
+        start = time.time()
+        result = func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+
+    opt_parser = OptionParser()
+    opt_parser.add_option('-n', '--resolution', type='int', default=48)
+    opt_parser.add_option('-a', '--advect', type='float', default=1.0)
+    opt_parser.add_option('-r', '--repeat', type='int', default=3)
+    opts, args = opt_parser.parse_args()
+
+    random.seed(0)
+    sandbox = tempfile.mkdtemp()
+    try:
+
+        shape, a, b = setup_blend(make_cache(sandbox, opts.resolution))
+        print '%d^3 voxels, blending into %r' % (opts.resolution, shape.resolution)
+
+        results = {}
+        for name, func in (
+            ('python', lambda: shape._blend_channel_python(a, b, 0.25, opts.advect, opts.advect)),
+            ('numpy', lambda: shape._blend_channel_numpy(a, b, 0.25, opts.advect, opts.advect)),
+            ('numpy, linear', lambda: shape._blend_channel_numpy(a, b, 0.25, opts.advect, opts.advect, 'linear')),
+        ):
+            elapsed, results[name] = timeit(func, opts.repeat)
+            print '%-24s %.3fs' % (name, elapsed)
+
+        # Channels are stored as single precision, which the loop produces directly.
+        error = max(abs(x - y) for x, y in zip(results['python'], array.array('f', results['numpy'])))
+        print '%-24s %g' % ('max difference', error)
+
+    finally:
+        shutil.rmtree(sandbox)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Synthetic fluid caches for the tests and benchmarks of mayatools.fluids."""
+
+import os
+import random
+
+from mayatools import binary
+
+
+_xml = '''<?xml version="1.0"?>
+<Autodesk_Cache_File>
+  <cacheType Type="OneFilePerFrame" Format="mcc"/>
+  <time Range="%(start)d-%(end)d"/>
+  <cacheTimePerFrame TimePerFrame="250"/>
+  <cacheVersion Version="2.0"/>
+  <extra>fluidShape1.resolutionW=%(res)d</extra>
+  <extra>fluidShape1.resolutionH=%(res)d</extra>
+  <extra>fluidShape1.resolutionD=%(res)d</extra>
+  <extra>fluidShape1.dimensionsW=%(res)d</extra>
+  <extra>fluidShape1.dimensionsH=%(res)d</extra>
+  <extra>fluidShape1.dimensionsD=%(res)d</extra>
+  <Channels>
+    <channel0 ChannelName="fluidShape1_density" ChannelType="FloatArray" ChannelInterpretation="density" SamplingType="Regular" SamplingRate="250" StartTime="%(start)d" EndTime="%(end)d"/>
+    <channel1 ChannelName="fluidShape1_velocity" ChannelType="FloatArray" ChannelInterpretation="velocity" SamplingType="Regular" SamplingRate="250" StartTime="%(start)d" EndTime="%(end)d"/>
+    <channel2 ChannelName="fluidShape1_resolution" ChannelType="FloatArray" ChannelInterpretation="resolution" SamplingType="Regular" SamplingRate="250" StartTime="%(start)d" EndTime="%(end)d"/>
+    <channel3 ChannelName="fluidShape1_offset" ChannelType="FloatArray" ChannelInterpretation="offset" SamplingType="Regular" SamplingRate="250" StartTime="%(start)d" EndTime="%(end)d"/>
+  </Channels>
+</Autodesk_Cache_File>
+'''
+
+
+def get_frame_name(time, base_name='cache'):
+    frame_no, tick = divmod(time, 250)
+    if tick:
+        return '%sFrame%dTick%d.mc' % (base_name, frame_no, tick)
+    return '%sFrame%d.mc' % (base_name, frame_no)
+
+
+def make_cache(directory, res, frame_count=2, times=None):
+    """Write a cache of a cubic fluid with random density and velocity, which
+    moves by a fraction of a voxel every frame.
+
+    :param int res: The resolution along every axis.
+    :param int frame_count: How many frames, one every 250 ticks from 250.
+    :param times: The start times of the frames, instead of ``frame_count``.
+    :returns: The path to the XML.
+
+    """
+
+    if times is None:
+        times = [250 * frame_no for frame_no in xrange(1, frame_count + 1)]
+
+    with open(os.path.join(directory, 'cache.xml'), 'w') as fh:
+        fh.write(_xml % dict(res=res, start=min(times), end=max(times)))
+
+    velocity_size = 3 * res ** 3 + 3 * res ** 2
+    for i, time in enumerate(times):
+        with open(os.path.join(directory, get_frame_name(time)), 'wb') as fh:
+            writer = binary.Writer(fh)
+            chunk = binary.Chunk(None)
+            with writer.group('CACH'):
+                writer.write_chunk('VRSN', '0.1\0')
+                chunk.ints = [time]
+                writer.write_chunk('STIM', chunk.data)
+                writer.write_chunk('ETIM', chunk.data)
+            with writer.group('MYCH'):
+                for interpretation, data in (
+                    ('density', [random.random() for j in xrange(res ** 3)]),
+                    ('velocity', [random.uniform(-1, 1) for j in xrange(velocity_size)]),
+                    ('resolution', [res] * 3),
+                    ('offset', [0.3 * (i + 1), 0, 0]),
+                ):
+                    writer.write_chunk('CHNM', 'fluidShape1_%s\0' % interpretation)
+                    chunk.ints = [len(data)]
+                    writer.write_chunk('SIZE', chunk.data)
+                    chunk.floats = data
+                    writer.write_chunk('FBCA', chunk.data)
+
+    return os.path.join(directory, 'cache.xml')
@@ -0,0 +1,663 @@
+import array
+import hashlib
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase, skipIf
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from mayatools import binary
+from mayatools.binary import __main__ as main, diff, du, validation
+
+
+def make_frame(density=(1.0, 2.0, 3.0, 4.0), start=250, end=250):
+    root = binary.Node()
+
+    header = root.add_group('CACH')
+    header.add_chunk('VRSN').string = '0.1'
+    header.add_chunk('STIM').ints = [start]
+    header.add_chunk('ETIM').ints = [end]
+
+    channels = root.add_group('MYCH')
+    channels.add_chunk('CHNM').string = 'fluidShape1_density'
+    channels.add_chunk('SIZE').ints = [len(density)]
+    channels.add_chunk('FBCA').floats = density
+    channels.add_chunk('CHNM').string = 'fluidShape1_resolution'
+    channels.add_chunk('SIZE').ints = [3]
+    channels.add_chunk('FBCA').floats = [1, 2, 2]
+
+    return root
+
+
+class BinaryTestCase(TestCase):
+
+    def setUp(self):
+        self.sandbox = tempfile.mkdtemp()
+        # Keep indices out of the user's cache.
+        self.environ = os.environ.copy()
+        os.environ['MAYATOOLS_BINARY_INDEX_DIR'] = os.path.join(self.sandbox, 'index')
+        os.environ.pop('MAYATOOLS_BINARY_INDEX_SIDECAR', None)
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.sandbox)
+
+    def write(self, name, root):
+        path = os.path.join(self.sandbox, name)
+        with open(path, 'wb') as fh:
+            for chunk in root.dumps_iter():
+                fh.write(chunk)
+        return path
+
+
+class TestParser(BinaryTestCase):
+
+    def test_roundtrip(self):
+        path = self.write('frame.mc', make_frame())
+        parser = binary.Parser.from_path(path)
+        parser.parse_all()
+        self.assertEqual(parser.find_one('VRSN').string, '0.1')
+        self.assertEqual(list(parser.find_one('STIM').ints), [250])
+        self.assertEqual(list(parser.find_one('FBCA').floats), [1.0, 2.0, 3.0, 4.0])
+        self.assertEqual([c.string for c in parser.find('CHNM')], ['fluidShape1_density', 'fluidShape1_resolution'])
+        self.assertEqual(''.join(parser.dumps_iter()), open(path, 'rb').read())
+        parser.close()
+
+    def test_mmap(self):
+        path = self.write('frame.mc', make_frame())
+        parser = binary.Parser.from_path(path, mmap=True)
+        parser.parse_all()
+        fbca = parser.find_one('FBCA')
+        self.assertIsInstance(fbca.data, buffer)
+        self.assertEqual(list(fbca.floats), [1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(parser.find_one('CHNM').string, 'fluidShape1_density')
+        self.assertEqual(''.join(str(x) for x in parser.dumps_iter()), open(path, 'rb').read())
+        parser.close()
+
+    def test_mmap_empty_file(self):
+        path = os.path.join(self.sandbox, 'empty.mc')
+        open(path, 'wb').close()
+        parser = binary.Parser.from_path(path, mmap=True)
+        parser.parse_all()
+        self.assertEqual(parser.children, [])
+        parser.close()
+
+    def test_lazy(self):
+        path = self.write('frame.mc', make_frame(density=range(100)))
+        parser = binary.Parser.from_path(path, lazy=True)
+        parser.parse_all()
+        fbca = list(parser.find('FBCA'))
+        self.assertFalse(fbca[0].is_loaded)
+        self.assertTrue(fbca[1].is_loaded)
+        self.assertEqual(fbca[0].size, 400)
+        self.assertEqual(list(fbca[0].floats), range(100))
+        self.assertTrue(fbca[0].is_loaded)
+        parser.close()
+
+    def test_lazy_eager_tags(self):
+        path = self.write('frame.mc', make_frame())
+        parser = binary.Parser.from_path(path, lazy=True, eager=['CHNM'])
+        parser.parse_all()
+        self.assertTrue(parser.find_one('CHNM').is_loaded)
+        self.assertFalse(parser.find_one('STIM').is_loaded)
+        self.assertEqual(list(parser.find_one('STIM').ints), [250])
+        parser.close()
+
+
+class TestIndex(BinaryTestCase):
+
+    def test_find(self):
+        path = self.write('frame.mc', make_frame())
+        index = binary.Index.build(path)
+        self.assertEqual(len(index), 11)
+        self.assertEqual(index.type(0), 'FOR4')
+        self.assertEqual(index.type(1), None)
+        self.assertEqual(list(index.find_one('STIM').ints), [250])
+        mych = index.positions('MYCH')[0]
+        self.assertEqual([c.string for c in index.find('CHNM', mych)], ['fluidShape1_density', 'fluidShape1_resolution'])
+        self.assertEqual(list(index.find_one('FBCA').floats), [1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(index.positions('VRSN', mych), [])
+        index.close()
+
+    def test_cache(self):
+        path = self.write('frame.mc', make_frame())
+        cache_dir = os.path.join(self.sandbox, 'cache')
+        index = binary.Index.for_path(path, cache_dir)
+        index_path = binary.get_index_path(path, cache_dir)
+        self.assertTrue(os.path.exists(index_path))
+
+        loaded = binary.Index.load(index_path)
+        self.assertEqual(loaded.tags, index.tags)
+        self.assertEqual(loaded.offsets, index.offsets)
+        self.assertEqual(loaded.parents, index.parents)
+        self.assertEqual(list(loaded.find_one('ETIM').ints), [250])
+        loaded.close()
+
+        # Rewriting the file invalidates the index.
+        self.write('frame.mc', make_frame(start=500))
+        os.utime(path, (0, 0))
+        index = binary.Index.for_path(path, cache_dir)
+        self.assertEqual(list(index.find_one('STIM').ints), [500])
+        index.close()
+
+
+    def test_index_paths(self):
+        path = os.path.join(self.sandbox, 'frame.mc')
+        digest = hashlib.sha1(path).hexdigest() + '.idx'
+
+        del os.environ['MAYATOOLS_BINARY_INDEX_DIR']
+        os.environ['XDG_CACHE_HOME'] = os.path.join(self.sandbox, 'xdg')
+        self.assertEqual(binary.get_index_path(path), os.path.join(self.sandbox, 'xdg', 'mayatools', 'binary-index', digest))
+
+        os.environ['MAYATOOLS_BINARY_INDEX_DIR'] = os.path.join(self.sandbox, 'env')
+        self.assertEqual(binary.get_index_path(path), os.path.join(self.sandbox, 'env', digest))
+        self.assertEqual(binary.get_index_path(path, 'explicit'), os.path.join('explicit', digest))
+
+        # Sidecars are opt-in.
+        sidecar = os.path.join(self.sandbox, '.frame.mc.idx')
+        self.assertEqual(binary.get_index_path(path, sidecar=True), sidecar)
+        os.environ['MAYATOOLS_BINARY_INDEX_SIDECAR'] = '1'
+        self.assertEqual(binary.get_index_path(path), sidecar)
+        self.assertEqual(binary.get_index_path(path, 'explicit'), os.path.join('explicit', digest))
+        os.environ['MAYATOOLS_BINARY_INDEX_SIDECAR'] = '0'
+        self.assertEqual(binary.get_index_path(path), os.path.join(self.sandbox, 'env', digest))
+
+    def test_no_sidecar(self):
+        path = self.write('frame.mc', make_frame())
+        binary.Index.for_path(path).close()
+        self.assertEqual(sorted(os.listdir(self.sandbox)), ['frame.mc', 'index'])
+
+
+class TestSelect(BinaryTestCase):
+
+    def assertSelects(self, selector, expected):
+        # Both the graph and the index must agree.
+        root = make_frame()
+        index = binary.Index.build(self.write('frame.mc', root))
+        for nodes in (list(root.select(selector)), list(index.select(selector))):
+            self.assertEqual([
+                tuple(n and n.tag for n in x) if isinstance(x, tuple) else x.tag
+                for x in nodes
+            ], expected)
+        index.close()
+
+    def test_paths(self):
+        self.assertSelects('MYCH/CHNM', ['CHNM', 'CHNM'])
+        self.assertSelects('/CACH/*', ['VRSN', 'STIM', 'ETIM'])
+        self.assertSelects('CHNM', [])
+        self.assertSelects('**/STIM', ['STIM'])
+        self.assertSelects('*', ['CACH', 'MYCH'])
+        self.assertSelects('**/*', ['CACH', 'VRSN', 'STIM', 'ETIM', 'MYCH'] + ['CHNM', 'SIZE', 'FBCA'] * 2)
+
+    def test_siblings(self):
+        self.assertSelects('MYCH/CHNM+SIZE+FBCA', [('CHNM', 'SIZE', 'FBCA')] * 2)
+        self.assertSelects('MYCH/SIZE+CHNM+XXXX', [('SIZE', 'CHNM', None), ('SIZE', None, None)])
+        root = make_frame()
+        names = [(n.string, list(f.floats)) for n, f in root.select('**/CHNM+FBCA')]
+        self.assertEqual(names, [('fluidShape1_density', [1, 2, 3, 4]), ('fluidShape1_resolution', [1, 2, 2])])
+
+    def test_within(self):
+        index = binary.Index.build(self.write('frame.mc', make_frame()))
+        mych = index.positions('MYCH')[0]
+        self.assertEqual([n.tag for n in index.select('*', within=mych)], ['CHNM', 'SIZE', 'FBCA'] * 2)
+        self.assertEqual(list(index.select('STIM', within=mych)), [])
+        index.close()
+
+    def test_compile(self):
+        self.assertIs(binary.compile_selector('MYCH/CHNM'), binary.compile_selector('MYCH/CHNM'))
+        for pattern in ('', 'MYCH//CHNM', 'MYCH/**', 'CHNM+*'):
+            self.assertRaises(ValueError, binary.Selector, pattern)
+
+
+class TestDecoding(TestCase):
+
+    def test_floats(self):
+        chunk = binary.Chunk('FBCA')
+        chunk.floats = [1.5, -2.0, 3.25]
+        self.assertEqual(chunk.data, struct.pack('>3f', 1.5, -2.0, 3.25))
+        self.assertEqual(list(chunk.floats), [1.5, -2.0, 3.25])
+
+        values = array.array('f', [4.0, 5.5])
+        chunk.floats = values
+        self.assertEqual(chunk.data, struct.pack('>2f', 4.0, 5.5))
+        self.assertEqual(list(values), [4.0, 5.5])
+
+    def test_ints(self):
+        chunk = binary.Chunk('SIZE')
+        chunk.ints = [1, 2 ** 32 - 1]
+        self.assertEqual(chunk.data, struct.pack('>2L', 1, 2 ** 32 - 1))
+        self.assertEqual(list(chunk.ints), [1, 2 ** 32 - 1])
+        # Decoded by swapping bytes, into an array of the same size.
+        self.assertEqual(chunk.ints.itemsize, 4)
+        chunk.ints = chunk.ints
+        self.assertEqual(chunk.data, struct.pack('>2L', 1, 2 ** 32 - 1))
+
+    @skipIf(numpy is None, 'requires numpy')
+    def test_numpy(self):
+        chunk = binary.Chunk('FBCA', struct.pack('>3f', 1.5, -2.0, 3.25))
+        values = chunk.as_numpy()
+        self.assertEqual(values.dtype, numpy.dtype('>f4'))
+        self.assertEqual(values.tolist(), [1.5, -2.0, 3.25])
+
+        chunk.set_numpy(numpy.arange(4, dtype='f8'))
+        self.assertEqual(list(chunk.floats), [0.0, 1.0, 2.0, 3.0])
+        chunk.set_numpy(array.array('f', [5, 6]))
+        self.assertEqual(list(chunk.floats), [5.0, 6.0])
+
+        chunk = binary.Chunk('SIZE')
+        chunk.set_numpy([7])
+        self.assertEqual(list(chunk.ints), [7])
+        self.assertEqual(chunk.as_numpy('f4').dtype, numpy.dtype('>f4'))
+        self.assertRaises(ValueError, binary.Chunk('XXXX', '').as_numpy)
+
+
+class TestHexdump(TestCase):
+
+    def test_raw(self):
+        self.assertEqual(binary.hexdump('FOR4\0\0\0\x28CACHVRSN\0\0\0\x04', 0x10), (
+            '0010: 464f5234 00000028 43414348 5652534e FOR4...(CACHVRSN\n'
+            '0020: 00000004                            ....\n'
+        ))
+
+    def test_encoded(self):
+        self.assertEqual(binary.hexdump(struct.pack('>2f', 1.5, 2.0), tag='FBCA'),
+            '0000: 3fc00000 40000000                   1.5 2.0\n'
+        )
+
+
+class TestFormatTag(TestCase):
+
+    def test_format_tag(self):
+        self.assertEqual(binary.format_tag('XFRM'), 'XFRM')
+        self.assertEqual(binary.format_tag('STR '), 'STR ')
+        self.assertEqual(binary.format_tag('\x00\x08\x00\x01'), '0x00080001')
+
+
+class TestWriter(BinaryTestCase):
+
+    def test_packed_size(self):
+        root = make_frame()
+        self.assertEqual(root.packed_size(), len(''.join(root.dumps_iter())))
+
+    def test_write_node(self):
+        root = make_frame()
+        path = os.path.join(self.sandbox, 'frame.mc')
+        with open(path, 'wb') as fh:
+            binary.Writer(fh).write(root)
+        self.assertEqual(open(path, 'rb').read(), ''.join(root.dumps_iter()))
+
+    def test_streaming(self):
+        path = os.path.join(self.sandbox, 'frame.mc')
+        with open(path, 'wb') as fh:
+            writer = binary.Writer(fh)
+            with writer.group('CACH'):
+                writer.write_chunk('VRSN', '0.1\0')
+                writer.write_chunk('STIM', struct.pack('>L', 250))
+                writer.write_chunk('ETIM', struct.pack('>L', 250))
+            with writer.group('MYCH'):
+                for name, values, size in (
+                    ('fluidShape1_density', [1.0, 2.0, 3.0, 4.0], 4),
+                    ('fluidShape1_resolution', [1, 2, 2], 3),
+                ):
+                    writer.write_chunk('CHNM', name + '\0')
+                    writer.write_chunk('SIZE', struct.pack('>L', size))
+                    writer.write_chunk('FBCA', struct.pack('>%df' % len(values), *values))
+        self.assertEqual(open(path, 'rb').read(), ''.join(make_frame().dumps_iter()))
+
+
+class TestPatch(BinaryTestCase):
+
+    def test_patch_chunk(self):
+        path = self.write('frame.mc', make_frame())
+        old = binary.patch_chunk(path, 'ETIM', struct.pack('>L', 500))
+        self.assertEqual(old, struct.pack('>L', 250))
+        self.assertEqual(open(path, 'rb').read(), ''.join(make_frame(end=500).dumps_iter()))
+        self.assertRaises(ValueError, binary.patch_chunk, path, 'STIM', '')
+        self.assertRaises(KeyError, binary.patch_chunk, path, 'XXXX', '')
+
+    def test_64bit(self):
+        path = os.path.join(self.sandbox, 'frame.mc')
+        with open(path, 'wb') as fh:
+            binary.Writer(fh, is_64bit=True).write(make_frame())
+        binary.patch_chunk(path, 'STIM', struct.pack('>L', 0))
+        self.assertEqual(list(binary.Index.build(path).find_one('STIM').ints), [0])
+
+
+class Test64Bit(BinaryTestCase):
+
+    def write_streaming(self, fh, is_64bit):
+        writer = binary.Writer(fh, is_64bit=is_64bit)
+        with writer.group('CACH'):
+            writer.write_chunk('VRSN', '0.1\0')
+            writer.write_chunk('STIM', struct.pack('>L', 250))
+            writer.write_chunk('ETIM', struct.pack('>L', 250))
+        writer.write(make_frame().children[1])
+
+    def test_roundtrip(self):
+        root = make_frame()
+        data = ''.join(root.dumps_iter(is_64bit=True))
+        self.assertEqual(data[:4], 'FOR8')
+        self.assertEqual(len(data), root.packed_size(is_64bit=True))
+
+        path = os.path.join(self.sandbox, 'frame.mc')
+        with open(path, 'wb') as fh:
+            fh.write(data)
+        parser = binary.Parser.from_path(path)
+        self.assertEqual(parser.is_64bit, None)
+        parser.parse_all()
+        self.assertTrue(parser.is_64bit)
+        self.assertEqual([g.type for g in parser.children], ['FOR8', 'FOR8'])
+        self.assertEqual(list(parser.find_one('FBCA').floats), [1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(parser.find_one('CHNM').string, 'fluidShape1_density')
+        self.assertEqual(''.join(parser.dumps_iter()), data)
+        self.assertEqual(''.join(parser.dumps_iter(is_64bit=False)), ''.join(root.dumps_iter()))
+        parser.close()
+
+        index = binary.Index.build(path)
+        self.assertTrue(index.is_64bit)
+        self.assertEqual(list(index.find_one('ETIM').ints), [250])
+        index.close()
+
+    def test_writer(self):
+        path = os.path.join(self.sandbox, 'frame.mc')
+        for is_64bit in (False, True):
+            with open(path, 'wb') as fh:
+                self.write_streaming(fh, is_64bit)
+            self.assertEqual(open(path, 'rb').read(), ''.join(make_frame().dumps_iter(is_64bit)))
+
+    def test_too_large(self):
+        fh = open(os.path.join(self.sandbox, 'frame.mc'), 'wb')
+        writer = binary.Writer(fh)
+        writer.start_group('CACH')
+        fh.seek(2 ** 32 + 16)
+        self.assertRaises(ValueError, writer.end_group)
+        fh.close()
+
+
+class TestIterParse(BinaryTestCase):
+
+    def test_events(self):
+        path = self.write('frame.mc', make_frame())
+        events = [(event, node.tag) for event, node in binary.iterparse(path)]
+        self.assertEqual(events[:5], [
+            ('start', 'CACH'),
+            ('chunk', 'VRSN'),
+            ('chunk', 'STIM'),
+            ('chunk', 'ETIM'),
+            ('end', 'CACH'),
+        ])
+        self.assertEqual(events[5], ('start', 'MYCH'))
+        self.assertEqual(events[-1], ('end', 'MYCH'))
+        self.assertEqual(len(events), 13)
+
+    def test_skip_and_tags(self):
+        path = self.write('frame.mc', make_frame())
+        events = binary.iterparse(open(path, 'rb'), tags=['CACH', 'MYCH', 'STIM', 'CHNM'])
+        seen = []
+        for event, node in events:
+            seen.append((event, node.tag))
+            if event == 'start' and node.tag == 'CACH':
+                events.skip()
+        self.assertEqual(seen, [
+            ('start', 'CACH'),
+            ('end', 'CACH'),
+            ('start', 'MYCH'),
+            ('chunk', 'CHNM'),
+            ('chunk', 'CHNM'),
+            ('end', 'MYCH'),
+        ])
+        events.close()
+
+    def test_no_graph(self):
+        path = self.write('frame.mc', make_frame())
+        for event, node in binary.iterparse(path):
+            if event == 'chunk':
+                self.assertEqual(node.parent.children, [])
+
+
+class TestBuffering(BinaryTestCase):
+
+    def parse(self, path, **kwargs):
+        parser = binary.Parser.from_path(path, **kwargs)
+        parser.parse_all()
+        nodes = [(n.tag, getattr(n, 'offset', None), getattr(n, 'end', None), str(getattr(n, 'data', ''))) for n in list(parser.walk())[1:]]
+        parser.close()
+        return nodes
+
+    def test_block_sizes(self):
+        path = self.write('frame.mc', make_frame(density=range(100)))
+        expected = self.parse(path, block_size=0)
+        for block_size in (1, 5, 16, 100, 65536):
+            self.assertEqual(self.parse(path, block_size=block_size), expected)
+            self.assertEqual(self.parse(path, block_size=block_size, lazy=True), expected)
+        self.assertEqual(self.parse(path, mmap=True), expected)
+
+    def test_truncated(self):
+        path = self.write('frame.mc', make_frame())
+        data = open(path, 'rb').read()
+        with open(path, 'wb') as fh:
+            fh.write(data[:-17])
+        parser = binary.Parser.from_path(path)
+        self.assertRaises(ValueError, parser.parse_all)
+
+
+class TestValidate(BinaryTestCase):
+
+    def truncate(self, path, size):
+        data = open(path, 'rb').read()
+        with open(path, 'wb') as fh:
+            fh.write(data[:size])
+
+    def test_valid(self):
+        path = self.write('frame.mc', make_frame())
+        self.assertIs(binary.validate(path), None)
+        path = self.write('frame64.mc', make_frame())
+        with open(path, 'wb') as fh:
+            binary.Writer(fh, is_64bit=True).write(make_frame())
+        self.assertIs(binary.validate(path), None)
+
+    def test_truncated(self):
+        path = self.write('frame.mc', make_frame())
+        self.truncate(path, 100)
+        error = binary.validate(path)
+        self.assertIsInstance(error, binary.ValidationError)
+        self.assertEqual(error.offset, 0x30) # The MYCH group.
+        self.assertEqual(error.path, path)
+
+        self.truncate(path, 52)
+        self.assertEqual(binary.validate(path).offset, 0x30)
+
+        self.truncate(path, 0)
+        self.assertEqual(binary.validate(path).message, 'Empty file')
+
+    def test_overrun(self):
+        path = self.write('frame.mc', make_frame())
+        data = open(path, 'rb').read()
+        # Grow the VRSN chunk past the end of the CACH group.
+        with open(path, 'wb') as fh:
+            fh.write(data[:0x10] + struct.pack('>L', 0x40) + data[0x14:])
+        error = binary.validate(path)
+        self.assertEqual((error.offset, error.tag), (0x0c, 'CACH'))
+
+
+class TestQuarantine(BinaryTestCase):
+
+    def test_quarantine(self):
+        path = self.write('frame.mc', make_frame())
+        index_path = binary.get_index_path(path)
+        binary.Index.for_path(path)
+        self.assertTrue(os.path.exists(index_path))
+        dst_path = validation.quarantine(path, 'bad')
+        self.assertEqual(dst_path, os.path.join(self.sandbox, 'bad', 'frame.mc'))
+        self.assertTrue(os.path.exists(dst_path))
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(index_path))
+
+    def test_collision(self):
+        path = self.write('frame.mc', make_frame())
+        os.makedirs(os.path.join(self.sandbox, 'bad'))
+        self.write(os.path.join('bad', 'frame.mc'), make_frame(density=()))
+        self.assertRaises(OSError, validation.quarantine, path, 'bad')
+        self.assertTrue(os.path.exists(path))
+
+    def test_main_continues(self):
+        for name in ('a.mc', 'b.mc'):
+            path = self.write(name, make_frame())
+            with open(path, 'r+b') as fh:
+                fh.truncate(20)
+        # The first cannot be moved, but the second still is.
+        os.makedirs(os.path.join(self.sandbox, 'bad'))
+        self.write(os.path.join('bad', 'a.mc'), make_frame())
+        root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        proc = subprocess.Popen([sys.executable, '-m', 'mayatools.binary.validation', '-Q', 'bad', self.sandbox],
+            cwd=root, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = proc.communicate()
+        self.assertEqual(proc.returncode, 1)
+        self.assertIn('a.mc: could not quarantine', err)
+        self.assertIn('1 could not be quarantined', err)
+        self.assertTrue(os.path.exists(os.path.join(self.sandbox, 'a.mc')))
+        self.assertTrue(os.path.exists(os.path.join(self.sandbox, 'bad', 'b.mc')))
+
+
+class TestInclude(BinaryTestCase):
+
+    def test_include(self):
+        path = self.write('frame.mc', make_frame())
+        parser = binary.Parser.from_path(path, include=['CACH'])
+        parser.parse_all()
+        self.assertEqual([c.tag for c in parser.children], ['CACH'])
+        self.assertEqual(list(parser.find_one('STIM').ints), [250])
+        self.assertEqual(parser.find_one('CHNM', None), None)
+        parser.close()
+
+    def test_predicate(self):
+        path = self.write('frame.mc', make_frame())
+        events = binary.iterparse(path, include=lambda tag: tag != 'CACH')
+        self.assertEqual([node.tag for event, node in events if event != 'end'][:2], ['MYCH', 'CHNM'])
+        events.close()
+
+
+class TestDu(BinaryTestCase):
+
+    def test_attribution(self):
+        path = os.path.join(self.sandbox, 'scene.mb')
+        with open(path, 'wb') as fh:
+            writer = binary.Writer(fh)
+            with writer.group('HEAD'):
+                writer.write_chunk('VERS', '2014\0')
+            with writer.group('XFRM'):
+                writer.write_chunk('CREA', '\x01ns:parent\0')
+                writer.write_chunk('STR ', 'x' * 10)
+                with writer.group('DMSH'):
+                    writer.write_chunk('CREA', '\x01child\0ns:parent\0')
+                    writer.write_chunk('DATA', 'y' * 100)
+
+        usage = du.du(path)
+        self.assertEqual(sum(r.size for r in usage), os.path.getsize(path))
+        by_name = dict((r.name, r) for r in usage)
+        self.assertEqual(by_name[None].type, 'HEAD')
+        self.assertEqual(by_name['child'].size, by_name['child'].total)
+        self.assertEqual(by_name['ns:parent'].total - by_name['ns:parent'].size, by_name['child'].total)
+        self.assertEqual(by_name['ns:parent'].namespace, 'ns')
+        self.assertEqual([ns for ns, count, size in du.aggregate(usage, 'namespace')], ['', 'ns', None])
+
+
+class TestDiff(BinaryTestCase):
+
+    def write_scene(self, name, nodes):
+        path = os.path.join(self.sandbox, name)
+        with open(path, 'wb') as fh:
+            writer = binary.Writer(fh)
+            with writer.group('HEAD'):
+                writer.write_chunk('VERS', '2014\0')
+            for node_name, value in nodes:
+                with writer.group('XFRM'):
+                    writer.write_chunk('CREA', '\x01%s\0' % node_name)
+                    writer.write_chunk('STR ', value)
+                    with writer.group('DMSH'):
+                        writer.write_chunk('CREA', '\x01%sShape\0%s\0' % (node_name, node_name))
+                        writer.write_chunk('DATA', value * 10)
+        return path
+
+    def test_diff(self):
+        a = self.write_scene('a.mb', [('same', 'x'), ('changed', 'x'), ('removed', 'x')])
+        b = self.write_scene('b.mb', [('same', 'x'), ('changed', 'y'), ('added', 'x')])
+        changed, added, removed = diff.diff(a, b)
+        self.assertEqual(changed, [('changed|changedShape', ['DATA']), ('changed', ['STR '])])
+        self.assertEqual(added, ['added|addedShape', 'added'])
+        self.assertEqual(removed, ['removed|removedShape', 'removed'])
+        self.assertEqual(diff.diff(a, a), ([], [], []))
+
+
+class TestMain(BinaryTestCase):
+
+    def run_main(self, *args):
+        root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        proc = subprocess.Popen([sys.executable, '-m', 'mayatools.binary'] + list(args),
+            cwd=root, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = proc.communicate()
+        return proc.returncode, out, err
+
+    def test_summarize(self):
+        path = self.write('frame.mc', make_frame())
+        summary = main.summarize(path)
+        self.assertEqual(dict((tag, count) for tag, (count, size) in summary.iteritems()), dict(
+            CACH=1, VRSN=1, STIM=1, ETIM=1, MYCH=1, CHNM=2, SIZE=2, FBCA=2,
+        ))
+        # Groups include their children, so the top level (and their headers)
+        # is the whole file.
+        self.assertEqual(summary['FBCA'][1], 4 * (4 + 3))
+        self.assertEqual(summary['CACH'][1] + summary['MYCH'][1] + 16, os.path.getsize(path))
+
+    def test_jobs(self):
+        paths = [
+            self.write('a.mc', make_frame()),
+            os.path.join(self.sandbox, 'missing.mc'),
+            self.write('b.mc', make_frame(density=(1.0, ) * 10)),
+        ]
+        serial = self.run_main('-S', *paths)
+        parallel = self.run_main('-S', '-j', '3', *paths)
+        self.assertEqual(parallel, serial)
+
+        code, out, err = parallel
+        self.assertEqual(code, 1)
+        self.assertEqual([line.split(':')[0] for line in out.splitlines() if not line.startswith(' ')], [
+            paths[0], paths[2], 'TOTAL',
+        ])
+        self.assertIn('missing.mc: [Errno 2]', err)
+
+    def test_hexdump(self):
+        path = self.write('frame.mc', make_frame())
+        code, out, err = self.run_main('-x', '-o', '4', '-l', '8', path, os.path.join(self.sandbox, 'missing.mc'))
+        self.assertEqual(code, 1)
+        self.assertEqual(out, binary.hexdump(open(path, 'rb').read()[4:12], 4) + '\n')
+        self.assertIn('missing.mc: [Errno 2]', err)
+
+    def test_hexdump_negative(self):
+        path = self.write('frame.mc', make_frame())
+        for args in (('-o', '-1'), ('-l', '-1')):
+            code, out, err = self.run_main('-x', path, *args)
+            self.assertEqual(code, 2)
+            self.assertIn('must not be negative', err)
+        self.assertRaises(ValueError, main.print_hexdump, path, -1)
+
+    def test_unexpected_error(self):
+
+        def summarize(path):
+            raise RuntimeError('injected')
+
+        original = main.summarize
+        main.summarize = summarize
+        try:
+            opts = type('Options', (object, ), dict(summary=True))
+            self.assertEqual(main._process(opts, 'x.mc'), ('x.mc', None, None, 'RuntimeError: injected'))
+        finally:
+            main.summarize = original
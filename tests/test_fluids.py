@@ -0,0 +1,440 @@
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from unittest import TestCase, skipIf
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from mayatools.fluids import offset, retime
+from mayatools.fluids.core import Cache, Frame, Shape, _sample_linear
+
+from fluids_common import make_cache
+
+
+class FluidTestCase(TestCase):
+
+    def setUp(self):
+        self.sandbox = tempfile.mkdtemp()
+        random.seed(0)
+        # Keep indices out of the user's cache.
+        self.environ = os.environ.copy()
+        os.environ['MAYATOOLS_BINARY_INDEX_DIR'] = os.path.join(self.sandbox, 'index')
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.sandbox)
+
+    def make_cache(self, res=3, **kwargs):
+        directory = os.path.join(self.sandbox, 'src')
+        os.makedirs(directory)
+        return Cache(make_cache(directory, res, **kwargs))
+
+
+class InjectedError(Exception):
+    pass
+
+
+class TestPipeline(FluidTestCase):
+
+    def setUp(self):
+        super(TestPipeline, self).setUp()
+        self.cache = self.make_cache(frame_count=3)
+        # One tick per task, so there is plenty left to do when a stage fails.
+        self.tasks = retime.plan_retime(self.cache, 250, 750, 250, 750, 25, chunk_size=1)
+        self.dst_base_path = os.path.join(self.sandbox, 'dst', 'out')
+        self.calls = dict(read=0, blend=0, write=0)
+        self.originals = dict(
+            read=retime._read_frame,
+            blend=retime.blend_frame,
+            write=retime.write_frame,
+        )
+
+    def tearDown(self):
+        retime._read_frame = self.originals['read']
+        retime.blend_frame = self.originals['blend']
+        retime.write_frame = self.originals['write']
+        super(TestPipeline, self).tearDown()
+
+    def instrument(self, fail=None, after=0):
+        # Count the calls of every stage, and fail one of them.
+        def wrap(name):
+            def func(*args, **kwargs):
+                self.calls[name] += 1
+                if name == fail and self.calls[name] > after:
+                    raise InjectedError(name)
+                return self.originals[name](*args, **kwargs)
+            return func
+        retime._read_frame = wrap('read')
+        retime.blend_frame = wrap('blend')
+        retime.write_frame = wrap('write')
+
+    def test_matches_serial(self):
+
+        retime.blend_tasks(self.cache.xml_path, self.tasks, self.dst_base_path, 1.0, depth=2)
+
+        expected_base_path = os.path.join(self.sandbox, 'expected', 'out')
+        ticks = 0
+        for task in self.tasks:
+            frame_a = Frame(self.cache, task.frame_a)
+            frame_b = Frame(self.cache, task.frame_b)
+            for src_time, dst_time in task.ticks:
+                dst_frame = retime.blend_frame(self.cache, src_time, dst_time, frame_a, frame_b, 1.0)
+                retime.write_frame(dst_frame, retime.get_dst_path(self.cache, expected_base_path, dst_time))
+                ticks += 1
+
+        names = sorted(os.listdir(os.path.dirname(expected_base_path)))
+        self.assertEqual(len(names), ticks)
+        self.assertEqual(sorted(os.listdir(os.path.dirname(self.dst_base_path))), names)
+        for name in names:
+            with open(os.path.join(os.path.dirname(expected_base_path), name), 'rb') as fh:
+                expected = fh.read()
+            with open(os.path.join(os.path.dirname(self.dst_base_path), name), 'rb') as fh:
+                self.assertEqual(fh.read(), expected, name)
+
+    def assertStops(self, fail, after=0):
+        self.instrument(fail, after)
+        try:
+            retime.blend_tasks(self.cache.xml_path, self.tasks, self.dst_base_path, 0.0, depth=2)
+        except InjectedError as e:
+            self.assertEqual(str(e), fail)
+        else:
+            self.fail('%s error was not raised' % fail)
+
+    def test_reader_failure(self):
+        # The first two frames cover the first half of the ticks, so this fails
+        # half way through, and nothing after that is blended.
+        self.assertStops('read', after=2)
+        self.assertEqual(self.calls['read'], 3)
+        self.assertTrue(self.calls['write'] <= self.calls['blend'] <= len(self.tasks) // 2 + 1)
+
+    def test_blender_failure(self):
+        self.assertStops('blend', after=1)
+        self.assertTrue(self.calls['write'] <= 1)
+        # Only a queue's depth of frames were read ahead.
+        self.assertTrue(self.calls['read'] <= 3)
+
+    def test_writer_failure(self):
+        self.assertStops('write')
+        self.assertEqual(self.calls['write'], 1)
+        # One being written, a full queue, and one waiting to join it.
+        self.assertTrue(len(self.tasks) > 20)
+        self.assertTrue(self.calls['blend'] <= 4, self.calls['blend'])
+        self.assertFalse(os.path.exists(os.path.dirname(self.dst_base_path)))
+
+
+class TestLocalExecutor(FluidTestCase):
+
+    def test_negative_jobs(self):
+        self.assertRaises(ValueError, retime.LocalExecutor, -1)
+        self.assertTrue(retime.LocalExecutor(0).jobs > 0)
+
+    def test_failure_report(self):
+
+        def func(i):
+            if i == 1:
+                raise InjectedError('call %d' % i)
+            open(os.path.join(self.sandbox, str(i)), 'w').close()
+
+        executor = retime.LocalExecutor(2, progress=False)
+        failed = executor.run(func, [('call%d' % i, [i]) for i in xrange(4)])
+        self.assertEqual([name for name, error in failed], ['call1'])
+        self.assertIn('InjectedError: call 1', failed[0][1])
+        self.assertEqual(sorted(os.listdir(self.sandbox)), ['0', '2', '3'])
+
+    def test_crash_retry(self):
+
+        def func(i):
+            marker = os.path.join(self.sandbox, str(i))
+            if i == 0 or not os.path.exists(marker):
+                open(marker, 'w').close()
+                # Die as if killed, without reporting anything.
+                os._exit(3)
+
+        executor = retime.LocalExecutor(2, retries=1, progress=False)
+        failed = executor.run(func, [('call%d' % i, [i]) for i in xrange(3)])
+        # The second call crashed once and then passed; the first always crashes.
+        self.assertEqual(failed, [('call0', 'process exited with code 3')])
+
+    def test_cancel(self):
+
+        def func(i):
+            time.sleep(0.2 if i < 2 else 10)
+
+        executor = retime.LocalExecutor(2, progress=False)
+        timer = threading.Timer(1.0, executor.cancel)
+        timer.start()
+        start = time.time()
+        failed = executor.run(func, [('call%d' % i, [i]) for i in xrange(5)])
+        timer.join()
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(failed, [('call%d' % i, 'cancelled') for i in xrange(2, 5)])
+
+
+class TestOffset(FluidTestCase):
+
+    def snapshot(self, directory):
+        # Sidecar indices are hidden, and are expected to be thrown away.
+        contents = {}
+        for name in os.listdir(directory):
+            if not name.startswith('.'):
+                with open(os.path.join(directory, name), 'rb') as fh:
+                    contents[name] = fh.read()
+        return contents
+
+    def test_offset(self):
+        cache = self.make_cache(frame_count=3)
+        offset.offset_cache(cache.xml_path, 125)
+
+        cache = Cache(cache.xml_path)
+        self.assertEqual([os.path.basename(path) for time, path in cache.frame_times], [
+            'cacheFrame1Tick125.mc', 'cacheFrame2Tick125.mc', 'cacheFrame3Tick125.mc',
+        ])
+        self.assertEqual([(frame.start_time, frame.end_time) for frame in cache.frames], [
+            (375, 375), (625, 625), (875, 875),
+        ])
+        cache.verify_frame_times()
+        self.assertEqual(cache.etree.find('time').get('Range'), '375-875')
+        for channel in cache.etree.find('Channels'):
+            self.assertEqual((channel.get('StartTime'), channel.get('EndTime')), ('375', '875'))
+
+    def test_overlapping_names(self):
+        # Every frame moves onto the name of the next one.
+        cache = self.make_cache(frame_count=3)
+        offset.offset_cache(cache.xml_path, 250)
+        cache = Cache(cache.xml_path)
+        self.assertEqual([time for time, path in cache.frame_times], [500, 750, 1000])
+        cache.verify_frame_times()
+
+    def test_rollback(self):
+
+        cache = self.make_cache(frame_count=3)
+        directory = os.path.dirname(cache.xml_path)
+        before = self.snapshot(directory)
+
+        # Fail on the first of the final renames, once all frames have been
+        # patched and moved to their temporary names.
+        renames = []
+        def rename(src, dst):
+            renames.append(dst)
+            if len(renames) == 4:
+                raise OSError('injected')
+            original_rename(src, dst)
+
+        original_rename = os.rename
+        os.rename = rename
+        try:
+            self.assertRaises(OSError, offset.offset_cache, cache.xml_path, 125)
+        finally:
+            os.rename = original_rename
+
+        # The rest of the renames were undoing the first three.
+        self.assertEqual([path.endswith('.offset.tmp') for path in renames[:4]], [True] * 3 + [False])
+        self.assertEqual(self.snapshot(directory), before)
+
+
+class TestReadChannels(FluidTestCase):
+
+    def setUp(self):
+        super(TestReadChannels, self).setUp()
+        self.cache = self.make_cache()
+        self.frame = self.cache.frames[0]
+
+    def test_only_requested(self):
+        shapes = self.frame.read_channels(('density', ))
+        self.assertEqual(shapes.keys(), ['fluidShape1'])
+        # The geometry is always read, so that the shape can be used.
+        self.assertEqual(sorted(shapes['fluidShape1'].channels), ['density', 'offset', 'resolution'])
+        self.assertEqual(len(shapes['fluidShape1'].channels['density'].data), 27)
+
+    def test_by_name(self):
+        shapes = self.frame.read_channels(('fluidShape1_velocity', 'missing'))
+        self.assertEqual(sorted(shapes['fluidShape1'].channels), ['offset', 'resolution', 'velocity'])
+
+    def test_rest_loaded_later(self):
+        self.frame.read_channels(('density', ))
+        density = self.frame._channels['fluidShape1_density']
+        self.assertEqual(sorted(self.frame.shapes['fluidShape1'].channels), ['density', 'offset', 'resolution', 'velocity'])
+        self.assertEqual(sorted(self.frame.channels), [
+            'fluidShape1_density', 'fluidShape1_offset', 'fluidShape1_resolution', 'fluidShape1_velocity',
+        ])
+        # What was already read was not read again.
+        self.assertIs(self.frame.channels['fluidShape1_density'], density)
+
+    def test_integer_resolution(self):
+        shape = self.frame.read_channels(())['fluidShape1']
+        self.assertEqual(shape.resolution, (3, 3, 3))
+        self.assertTrue(all(type(x) is int for x in shape.resolution))
+        self.assertEqual(shape.channels['resolution'].data.typecode, 'f')
+
+
+@skipIf(numpy is None, 'requires numpy')
+class TestSampling(FluidTestCase):
+
+    def setUp(self):
+        super(TestSampling, self).setUp()
+        self.cache = self.make_cache()
+        self.shape = self.cache.frames[0].shapes['fluidShape1']
+        # A ramp along every axis, which interpolates exactly.
+        x, y, z = self.shape.center_grid()
+        self.density = self.shape.channels['density']
+        self.density.data = x + 10 * y + 100 * z
+
+    def random_points(self, count, margin=0.0):
+        return [
+            numpy.array([random.uniform(lo - margin, hi + margin) for i in xrange(count)])
+            for lo, hi in zip(self.shape.bb_min, self.shape.bb_max)
+        ]
+
+    def test_ramp(self):
+        dims = (3, 4, 5)
+        data = numpy.array([[x + 10 * y + 100 * z] for z in xrange(5) for y in xrange(4) for x in xrange(3)], dtype=float)
+        coords = [numpy.array([random.uniform(0, dim - 1) for i in xrange(50)]) for dim in dims]
+        values = _sample_linear(data, dims, coords)
+        numpy.testing.assert_allclose(values[:, 0], coords[0] + 10 * coords[1] + 100 * coords[2])
+
+    def test_clamping(self):
+        dims = (3, 1, 2)
+        data = numpy.array([[x + 10 * z] for z in xrange(2) for x in xrange(3)], dtype=float)
+        coords = [numpy.array(c, dtype=float) for c in (
+            [-1.0, 2.5, 10.0, 1.5],
+            [0.0, -3.0, 0.5, 7.0],
+            [0.5, -1.0, 1.0, 3.0],
+        )]
+        values = _sample_linear(data, dims, coords)
+        numpy.testing.assert_allclose(values[:, 0], [5.0, 2.0, 12.0, 11.5])
+
+    def test_sample_values(self):
+
+        x, y, z = self.shape.center_grid()
+        numpy.testing.assert_allclose(self.shape.sample_values(self.density, x, y, z)[:, 0], self.density.data)
+
+        # Between the centres is exact, and within half a voxel of the bounds
+        # takes the value at the edge.
+        lo = [b + 0.5 for b in self.shape.bb_min]
+        hi = [b - 0.5 for b in self.shape.bb_max]
+        x, y, z = self.random_points(50)
+        values = self.shape.sample_values(self.density, x, y, z)[:, 0]
+        x, y, z = [numpy.clip(c, l, h) for c, l, h in zip((x, y, z), lo, hi)]
+        numpy.testing.assert_allclose(values, x + 10 * y + 100 * z, atol=1e-4)
+
+        # Outside of the bounds is empty.
+        values = self.shape.sample_values(self.density, *[numpy.array([b - 0.01]) for b in self.shape.bb_min])
+        self.assertEqual(values.tolist(), [[0.0]])
+
+    def test_sample_velocities(self):
+        # A constant field samples to the same constant anywhere inside.
+        res = self.shape.resolution[0]
+        size = (res + 1) * res * res
+        velocity = self.shape.channels['velocity']
+        velocity.data = [1.0] * size + [2.0] * size + [3.0] * size
+        values = self.shape.sample_velocities(velocity, *self.random_points(20))
+        numpy.testing.assert_allclose(values, [[1.0, 2.0, 3.0]] * 20)
+
+    def test_nearest_matches_lookup(self):
+
+        x, y, z = self.random_points(100, margin=1.0)
+        values = self.shape.lookup_values(self.density, x, y, z)
+        expected = [self.shape.lookup_value(self.density, *point) for point in zip(x, y, z)]
+        numpy.testing.assert_allclose(values, expected)
+
+        x, y, z = self.random_points(100)
+        velocity = self.shape.channels['velocity']
+        values = self.shape.lookup_velocities(velocity, x, y, z)
+        expected = [self.shape.lookup_velocity(velocity, *point) for point in zip(x, y, z)]
+        numpy.testing.assert_allclose(values, expected)
+
+    def test_nearest_blend_matches_python(self):
+        frame_a, frame_b = self.cache.frames[:2]
+        shape = Shape.setup_blend(Frame(self.cache), 'fluidShape1', frame_a, frame_b)
+        a = shape.src_a.channels['density']
+        b = shape.src_b.channels['density']
+        expected = shape._blend_channel_python(a, b, 0.25, 1.0, 1.0)
+        values = shape._blend_channel_numpy(a, b, 0.25, 1.0, 1.0, 'nearest')
+        numpy.testing.assert_allclose(values, expected, rtol=1e-5)
+
+
+class TestFrameTimes(FluidTestCase):
+
+    def setUp(self):
+        super(TestFrameTimes, self).setUp()
+        self.cache = self.make_cache(times=[250, 375, 500, 1000])
+        self.directory = os.path.dirname(self.cache.xml_path)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_mixed_names(self):
+        # Other files in the directory are ignored.
+        open(self.path('cacheFrame9.mc.bak'), 'w').close()
+        open(self.path('otherFrame9.mc'), 'w').close()
+        self.assertEqual(self.cache.frame_times, [
+            (250, self.path('cacheFrame1.mc')),
+            (375, self.path('cacheFrame1Tick125.mc')),
+            (500, self.path('cacheFrame2.mc')),
+            (1000, self.path('cacheFrame4.mc')),
+        ])
+        self.cache.verify_frame_times()
+
+    def test_between(self):
+        self.assertEqual(self.cache.get_frames_for(375), (self.path('cacheFrame1Tick125.mc'), ) * 2)
+        self.assertEqual(self.cache.get_frames_for(300), (self.path('cacheFrame1.mc'), self.path('cacheFrame1Tick125.mc')))
+        self.assertEqual(self.cache.get_frames_for(750), (self.path('cacheFrame2.mc'), self.path('cacheFrame4.mc')))
+        self.assertEqual(self.cache.get_frames_for(1000), (self.path('cacheFrame4.mc'), ) * 2)
+
+    def test_outside(self):
+        for time in (0, 249, 1001):
+            try:
+                self.cache.get_frames_for(time)
+            except ValueError as e:
+                self.assertIn('have from 1:0 to 4:0', str(e))
+            else:
+                self.fail('found frames for %d' % time)
+
+    def test_mismatch(self):
+        os.rename(self.path('cacheFrame4.mc'), self.path('cacheFrame3.mc'))
+        try:
+            Cache(self.cache.xml_path).verify_frame_times()
+        except ValueError as e:
+            self.assertEqual(str(e), '%s starts at 1000, but is named for 750' % self.path('cacheFrame3.mc'))
+        else:
+            self.fail('mismatch was not found')
+
+
+class TestPlanRetime(FluidTestCase):
+
+    def setUp(self):
+        super(TestPlanRetime, self).setUp()
+        self.cache = self.make_cache(times=[250, 500, 625, 1000])
+        self.starts = dict((path, time) for time, path in self.cache.frame_times)
+
+    def plan(self, chunk_size=None):
+        # Slow down by 3x, so that there are many ticks between frames.
+        return retime.plan_retime(self.cache, 250, 1000, 250, 2500, 50, chunk_size=chunk_size)
+
+    def test_covers_every_tick(self):
+        for chunk_size in (None, 1, 4):
+            ticks = [dst_time for task in self.plan(chunk_size) for src_time, dst_time in task.ticks]
+            self.assertEqual(ticks, range(250, 2501, 50))
+
+    def test_chunk_size(self):
+        # Ticks exactly on a frame need only that frame.
+        self.assertEqual([len(task.ticks) for task in self.plan()], [1, 14, 1, 7, 22, 1])
+        self.assertEqual([len(task.ticks) for task in self.plan(4)], [1, 4, 4, 4, 2, 1, 4, 3, 4, 4, 4, 4, 4, 2, 1])
+
+    def test_surrounding_frames(self):
+        for task in self.plan(4):
+            start_a = self.starts[task.frame_a]
+            start_b = self.starts[task.frame_b]
+            for src_time, dst_time in task.ticks:
+                self.assertTrue(start_a <= src_time <= start_b, (start_a, src_time, start_b))
+                # There is no frame closer on either side.
+                self.assertFalse(any(start_a < start < start_b for start in self.starts.itervalues()))
+                if start_a == start_b:
+                    self.assertEqual(src_time, start_a)
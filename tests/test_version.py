@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mayatools import binary
+from mayatools.version import detect_version
+
+
+class TestBinaryVersion(TestCase):
+
+    def setUp(self):
+        self.sandbox = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.sandbox)
+
+    def write_scene(self, name='scene.mb'):
+        # Laid out like a real scene: everything is within a "Maya" group.
+        path = os.path.join(self.sandbox, name)
+        with open(path, 'wb') as fh:
+            writer = binary.Writer(fh)
+            with writer.group('Maya'):
+                with writer.group('FINF'):
+                    writer.write_chunk('FINF', 'application\0maya\0')
+                with writer.group('HEAD'):
+                    writer.write_chunk('VERS', '2014\0')
+                    writer.write_chunk('UVER', '1\0')
+                with writer.group('XFRM'):
+                    writer.write_chunk('CREA', '\x01node\0')
+        return path
+
+    def test_nested_header(self):
+        self.assertEqual(detect_version(self.write_scene()), '2014')
+
+    def test_missing_version(self):
+        path = os.path.join(self.sandbox, 'scene.mb')
+        with open(path, 'wb') as fh:
+            writer = binary.Writer(fh)
+            with writer.group('Maya'):
+                with writer.group('XFRM'):
+                    writer.write_chunk('CREA', '\x01node\0')
+        self.assertRaises(KeyError, detect_version, path)
+
+    def test_ascii(self):
+        path = os.path.join(self.sandbox, 'scene.ma')
+        with open(path, 'w') as fh:
+            fh.write('//Maya ASCII 2014 scene\nrequires maya "2014";\n')
+        self.assertEqual(detect_version(path), '2014')